@@ -0,0 +1,23 @@
+"""Shared helpers for the local benchmark scripts."""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from statistics import quantiles
+
+ROOT = Path(__file__).resolve().parents[1]
+APP_ROOT = ROOT / "virtual-meter"
+if str(APP_ROOT) not in sys.path:
+    sys.path.insert(0, str(APP_ROOT))
+
+
+def summarize(label: str, samples_s: list[float], elapsed_s: float) -> str:
+    """Format latency percentiles (ms) and throughput for one benchmark run."""
+    cuts = quantiles(samples_s, n=100, method="inclusive")
+    return (
+        f"{label:<24} n={len(samples_s):>6} "
+        f"p50={cuts[49] * 1000:.3f}ms p99={cuts[98] * 1000:.3f}ms "
+        f"max={max(samples_s) * 1000:.3f}ms "
+        f"rate={len(samples_s) / elapsed_s:,.0f}/s"
+    )
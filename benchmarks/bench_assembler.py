@@ -0,0 +1,99 @@
+"""Measure one pipeline tick with every Pro 3EM status field mapped.
+
+A tick is ``decode`` -> ``build_dynamic_payloads`` -> ``encode`` on a
+three-phase Tasmota ``Status 10`` body. Exits non-zero when p99 tick time
+exceeds the budget.
+
+    python benchmarks/bench_assembler.py [ticks] [budget_ms]
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+import json
+import sys
+import time
+
+import _common  # noqa: F401  (sets up the import path)
+from _common import summarize
+
+from app.assembler import FIELDS, build_dynamic_payloads
+from app.config import Settings
+from app.serializer import decode, encode
+
+ENERGY_KEYS = {
+    "act_power": "Power",
+    "aprt_power": "ApparentPower",
+    "voltage": "Voltage",
+    "current": "Current",
+    "pf": "Factor",
+    "freq": "Frequency",
+    "total_act_energy": "Total",
+    "total_act_ret_energy": "Exported",
+}
+
+RAW = json.dumps(
+    {
+        "StatusSNS": {
+            "Time": "2024-01-02T12:34:56",
+            "ENERGY": {
+                "Power": [512, -143, 87],
+                "ApparentPower": [530, 160, 95],
+                "Voltage": [231.2, 229.8, 230.4],
+                "Current": [2.291, 0.696, 0.412],
+                "Factor": [0.97, -0.89, 0.92],
+                "Frequency": [50.01, 50.01, 50.01],
+                "Total": [1234.567, 987.654, 456.789],
+                "Exported": [12.345, 67.89, 1.234],
+                "Neutral": 1.021,
+            },
+        }
+    }
+).encode("utf-8")
+
+
+def _all_fields_settings() -> Settings:
+    options: dict[str, object] = {
+        "provider_endpoint": "http://bench",
+        "poll_interval_ms": 1000,
+        "n_current_json": "StatusSNS.ENERGY.Neutral",
+    }
+    # Tasmota reports energy totals in kWh; the payload fields are in Wh.
+    options["field_scales"] = ", ".join(
+        f"{phase}_{suffix}=1000"
+        for phase in ("l1", "l2", "l3")
+        for suffix in ("total_act_energy", "total_act_ret_energy")
+    )
+    for spec in FIELDS:
+        phase, _, suffix = spec.key.partition("_")
+        if phase.startswith("l"):
+            index = int(phase[1]) - 1
+            options[f"{spec.key}_json"] = (
+                f"StatusSNS.ENERGY.{ENERGY_KEYS[suffix]}.{index}"
+            )
+    return Settings(**options)
+
+
+def main(ticks: int, budget_ms: float) -> int:
+    settings = _all_fields_settings()
+    now = datetime.now(timezone.utc)
+    samples: list[float] = []
+    started = time.perf_counter()
+    for _ in range(ticks):
+        tick_started = time.perf_counter()
+        payloads = build_dynamic_payloads(decode(RAW), now, settings, "ABCDEF123456")
+        {method: encode(body) for method, body in payloads.items()}
+        samples.append(time.perf_counter() - tick_started)
+    elapsed = time.perf_counter() - started
+    print(f"fields mapped: {len(FIELDS)}")
+    print(summarize("tick (all fields)", samples, elapsed))
+    p99_ms = sorted(samples)[int(len(samples) * 0.99)] * 1000
+    within = p99_ms <= budget_ms
+    print(f"budget {budget_ms:.3f}ms: {'ok' if within else 'EXCEEDED'}")
+    return 0 if within else 1
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    sys.exit(main(count, budget))
@@ -0,0 +1,104 @@
+"""Measure HttpConsumer latency, throughput, and recovery against the simulator.
+
+Scenarios run back to back on loopback: a clean meter, a long-tailed Wi-Fi
+latency profile with random faults, and a full outage followed by recovery.
+
+    python benchmarks/bench_consumer.py [seconds_per_scenario]
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import time
+
+import _common  # noqa: F401  (sets up the import path)
+from _common import summarize
+
+from app import metrics
+from app.consumer import HttpConsumer, UpstreamHealth
+from app.simulator import (
+    SimulatorConfig,
+    UpstreamSimulator,
+    fixed_latency,
+    lognormal_latency,
+    sine,
+)
+
+POLL_INTERVAL_MS = 50
+
+
+async def _poll(config: SimulatorConfig, seconds: float, label: str) -> None:
+    simulator = UpstreamSimulator(config)
+    url = await simulator.start()
+    consumer = HttpConsumer(
+        url, POLL_INTERVAL_MS, None, None, fetch_timeout_s=0.5, probe_timeout_s=0.25
+    )
+    samples: list[float] = []
+
+    async def on_update(_snapshot) -> None:
+        samples.append(time.monotonic() - simulator.last_request_at)
+
+    failures_before = metrics.get("upstream_failures")
+    started = time.perf_counter()
+    task = asyncio.create_task(consumer.start(on_update))
+    await asyncio.sleep(seconds)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    await simulator.stop()
+    print(summarize(label, samples, elapsed))
+    print(
+        f"{'':<24} failures={metrics.get('upstream_failures') - failures_before} "
+        f"served={simulator.stats}"
+    )
+
+
+async def _recovery(outage_s: float) -> None:
+    simulator = UpstreamSimulator(SimulatorConfig(latency=fixed_latency(2.0)))
+    url = await simulator.start()
+    consumer = HttpConsumer(
+        url, POLL_INTERVAL_MS, None, None, fetch_timeout_s=0.5, probe_timeout_s=0.25
+    )
+    task = asyncio.create_task(consumer.start())
+    while consumer.latest is None:
+        await asyncio.sleep(0.01)
+    simulator.queue_faults("timeout", 10_000)
+    await asyncio.sleep(outage_s)
+    state = consumer.health.value
+    simulator.clear_faults()
+    restored = time.monotonic()
+    while consumer.health is not UpstreamHealth.HEALTHY:
+        await asyncio.sleep(0.005)
+    recovered_after = time.monotonic() - restored
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await simulator.stop()
+    print(
+        f"{'recovery':<24} outage={outage_s:.1f}s state_during={state} "
+        f"recovered_after={recovered_after * 1000:.0f}ms "
+        f"requests_during_outage={simulator.stats['timeout']}"
+    )
+
+
+async def _run(seconds: float) -> None:
+    await _poll(SimulatorConfig(update_interval_s=0.05), seconds, "clean")
+    await _poll(
+        SimulatorConfig(
+            profile=sine(400.0, 300.0, 10.0),
+            update_interval_s=0.05,
+            latency=lognormal_latency(15.0, 0.8),
+            timeout_rate=0.02,
+            truncate_rate=0.02,
+            warning_rate=0.01,
+        ),
+        seconds,
+        "wifi + faults",
+    )
+    await _recovery(seconds)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    asyncio.run(_run(float(sys.argv[1]) if len(sys.argv) > 1 else 5.0))
@@ -0,0 +1,41 @@
+"""Compare closed-loop battery regulation across poll intervals, offsets and transports.
+
+Each combination runs the real pipeline and app against the simulated
+household in ``app.battery_sim`` at accelerated time.
+
+    python benchmarks/bench_control.py [duration_s] [speed]
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+
+import _common  # noqa: F401  (sets up the import path)
+
+from app.battery_sim import TRANSPORTS, ControlScenario, run_scenario
+
+POLL_INTERVALS_MS = (250, 1000, 2000)
+OFFSETS_W = (0.0, -30.0)
+
+
+async def _run(duration_s: float, speed: float) -> None:
+    for poll_interval_ms in POLL_INTERVALS_MS:
+        for offset in OFFSETS_W:
+            for transport in TRANSPORTS:
+                report = await run_scenario(
+                    ControlScenario(
+                        duration_s=duration_s,
+                        speed=speed,
+                        poll_interval_ms=poll_interval_ms,
+                        power_offset=offset,
+                        transport=transport,
+                    )
+                )
+                print(report.row())
+
+
+if __name__ == "__main__":
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 300.0
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else 30.0
+    asyncio.run(_run(duration, speed))
@@ -0,0 +1,85 @@
+"""Compare the raw fast path with the aiohttp stack for hot ``GET /rpc`` calls.
+
+Both servers run in this process on loopback; clients speak raw HTTP/1.1 over
+keep-alive connections so client overhead stays small and identical.
+
+    python benchmarks/bench_fastpath.py [requests] [connections]
+"""
+
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+import sys
+import time
+
+import _common  # noqa: F401  (sets up the import path)
+from _common import summarize
+
+from aiohttp import web
+
+from app.assembler import build_dynamic_payloads
+from app.cache import set_payloads
+from app.config import Settings
+from app.fastpath import FastPathSite
+from app.provider import create_app
+from app.serializer import encode
+
+DEVICE_ID = "shellypro3em-abcdef123456"
+REQUEST = b"GET /rpc?method=EM.GetStatus HTTP/1.1\r\nHost: bench\r\n\r\n"
+
+
+async def _client(port: int, count: int, samples: list[float]) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for _ in range(count):
+        started = time.perf_counter()
+        writer.write(REQUEST)
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = int(head.lower().split(b"content-length: ")[1].split(b"\r\n")[0])
+        await reader.readexactly(length)
+        samples.append(time.perf_counter() - started)
+    writer.close()
+
+
+async def _measure(
+    port: int, requests: int, connections: int
+) -> tuple[list[float], float]:
+    samples: list[float] = []
+    await _client(port, 200, [])
+    started = time.perf_counter()
+    per_client = requests // connections
+    await asyncio.gather(
+        *(_client(port, per_client, samples) for _ in range(connections))
+    )
+    return samples, time.perf_counter() - started
+
+
+async def _run(requests: int, connections: int) -> None:
+    settings = Settings(
+        provider_endpoint="http://bench",
+        poll_interval_ms=1000,
+        l1_act_power_json="StatusSNS.ENERGY.Power",
+    )
+    source = {"StatusSNS": {"ENERGY": {"Power": 123.4}}}
+    now = datetime.now(timezone.utc)
+    payloads = build_dynamic_payloads(source, now, settings, "ABCDEF123456")
+    set_payloads({method: encode(body) for method, body in payloads.items()})
+
+    runner = web.AppRunner(create_app(settings, DEVICE_ID))
+    await runner.setup()
+    baseline = web.TCPSite(runner, "127.0.0.1", 0)
+    fast = FastPathSite(runner, DEVICE_ID, "127.0.0.1", 0)
+    await baseline.start()
+    await fast.start()
+    try:
+        for label, site in (("aiohttp", baseline), ("fast path", fast)):
+            samples, elapsed = await _measure(site.port, requests, connections)
+            print(summarize(f"{label} (c={connections})", samples, elapsed))
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    conns = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    asyncio.run(_run(total, conns))
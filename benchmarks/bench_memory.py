@@ -0,0 +1,57 @@
+"""Report steady-state RSS and per-tick allocations of the pipeline.
+
+RSS is sampled after interpreter start, after importing the add-on, and after
+``ticks`` pipeline ticks with every status field mapped; tracemalloc then
+measures the transient peak and retained memory of a single tick.
+
+    python benchmarks/bench_memory.py [ticks]
+"""
+
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+import sys
+
+import _common  # noqa: F401  (sets up the import path)
+
+from app.profiling import measure_tick_allocations, rss_bytes
+
+RSS_START = rss_bytes()
+
+from app.main import create_snapshot_handler  # noqa: E402
+from app.consumer import ConsumerSnapshot  # noqa: E402
+
+RSS_IMPORTED = rss_bytes()
+
+from bench_assembler import RAW, _all_fields_settings  # noqa: E402
+
+
+def _mib(value: float) -> str:
+    return f"{value / (1024 * 1024):.1f} MiB"
+
+
+async def _run(ticks: int) -> None:
+    handle = create_snapshot_handler(_all_fields_settings(), "ABCDEF123456")
+
+    async def _tick() -> None:
+        await handle(ConsumerSnapshot(raw=RAW, fetched_at=datetime.now(timezone.utc)))
+
+    for _ in range(ticks):
+        await _tick()
+    rss_steady = rss_bytes()
+    report = await measure_tick_allocations(_tick, ticks=min(ticks, 1000))
+    print(f"{'rss at start':<24}{_mib(RSS_START)}")
+    print(f"{'rss after imports':<24}{_mib(RSS_IMPORTED)}")
+    print(f"{f'rss after {ticks} ticks':<24}{_mib(rss_steady)}")
+    print(
+        f"per tick: peak={report['peak_bytes']:,.0f}B "
+        f"mean_peak={report['mean_peak_bytes']:,.0f}B "
+        f"retained={report['retained_bytes']:,.1f}B"
+    )
+    loaded = sorted(name for name in sys.modules if name.startswith("app."))
+    print(f"app modules loaded: {', '.join(loaded)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000))
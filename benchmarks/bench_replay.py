@@ -0,0 +1,90 @@
+"""Replay a recording through decode -> assemble -> encode at maximum speed.
+
+Without a recording argument a synthetic three-phase Tasmota recording is
+generated, so the run is deterministic either way.
+
+    python benchmarks/bench_replay.py [recording] [snapshots]
+"""
+
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import _common  # noqa: F401  (sets up the import path)
+from _common import summarize
+
+from app.config import Settings
+from app.consumer import ConsumerSnapshot
+from app.main import create_snapshot_handler
+from app.recorder import ReplayConsumer, SnapshotRecorder
+
+SETTINGS = Settings(
+    provider_endpoint="http://bench",
+    poll_interval_ms=1000,
+    l1_act_power_json="StatusSNS.ENERGY.Power.0",
+    l2_act_power_json="StatusSNS.ENERGY.Power.1",
+    l3_act_power_json="StatusSNS.ENERGY.Power.2",
+    l1_voltage_json="StatusSNS.ENERGY.Voltage.0",
+    l2_voltage_json="StatusSNS.ENERGY.Voltage.1",
+    l3_voltage_json="StatusSNS.ENERGY.Voltage.2",
+    l1_current_json="StatusSNS.ENERGY.Current.0",
+    l2_current_json="StatusSNS.ENERGY.Current.1",
+    l3_current_json="StatusSNS.ENERGY.Current.2",
+)
+
+
+def _synthesize(path: Path, count: int) -> None:
+    rng = random.Random(42)
+    start = datetime(2024, 1, 2, tzinfo=timezone.utc)
+    recorder = SnapshotRecorder(str(path), max_bytes=1 << 30)
+    for index in range(count):
+        power = [round(rng.uniform(-800, 2500), 1) for _ in range(3)]
+        voltage = [round(rng.uniform(226, 234), 1) for _ in range(3)]
+        body = {
+            "StatusSNS": {
+                "ENERGY": {
+                    "Power": power,
+                    "Voltage": voltage,
+                    "Current": [round(abs(p) / v, 3) for p, v in zip(power, voltage)],
+                }
+            }
+        }
+        recorder.append(
+            ConsumerSnapshot(
+                raw=json.dumps(body).encode("utf-8"),
+                fetched_at=start + timedelta(seconds=index),
+            )
+        )
+    recorder.close()
+
+
+async def _run(path: Path) -> None:
+    handler = create_snapshot_handler(SETTINGS, "ABCDEF123456")
+    samples: list[float] = []
+
+    async def _timed(snapshot: ConsumerSnapshot) -> None:
+        started = time.perf_counter()
+        await handler(snapshot)
+        samples.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await ReplayConsumer(str(path), speed=0).start(_timed)
+    print(summarize("replay pipeline tick", samples, time.perf_counter() - started))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1]:
+        asyncio.run(_run(Path(sys.argv[1])))
+    else:
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+        with tempfile.TemporaryDirectory() as tmp:
+            recording = Path(tmp) / "snapshots.rec"
+            _synthesize(recording, count)
+            asyncio.run(_run(recording))
@@ -4,7 +4,7 @@ from datetime import datetime, timezone
 
 import pytest
 
-from app.assembler import build_dynamic_payloads
+from app.assembler import FIELDS, build_dynamic_payloads
 from app.config import Settings
 
 
@@ -31,7 +31,11 @@ def test_build_dynamic_payloads_merges_values_and_offsets():
     now = datetime(2024, 1, 2, 12, 34, tzinfo=timezone.utc)
     payloads = build_dynamic_payloads(source, now, settings, device_mac="ABCDEF123456")
 
-    assert set(payloads.keys()) == {"Shelly.GetStatus", "EM.GetStatus"}
+    assert set(payloads.keys()) == {
+        "Shelly.GetStatus",
+        "EM.GetStatus",
+        "EMData.GetStatus",
+    }
     em_status = payloads["EM.GetStatus"]
     shelly_status = payloads["Shelly.GetStatus"]
 
@@ -73,3 +77,85 @@ def test_build_dynamic_payloads_does_not_apply_offset_without_value():
     payloads = build_dynamic_payloads(source, now, settings, device_mac="ABCDEF123456")
 
     assert payloads["EM.GetStatus"]["a_act_power"] == pytest.approx(0.0)
+
+
+def test_build_dynamic_payloads_emits_full_field_set_with_derived_values():
+    source = {
+        "StatusSNS": {
+            "ENERGY": {
+                "Power": [230.0, -115.0, 0],
+                "Voltage": [230.0, 230.0, 230.0],
+                "Current": [1.0, 0.5, 0.0],
+                "Frequency": 50.02,
+                "Total": 12.345,
+            }
+        }
+    }
+    settings = Settings(
+        provider_endpoint="http://example",
+        poll_interval_ms=1000,
+        l1_act_power_json="StatusSNS.ENERGY.Power.0",
+        l2_act_power_json="StatusSNS.ENERGY.Power.1",
+        l3_act_power_json="StatusSNS.ENERGY.Power.2",
+        l1_voltage_json="StatusSNS.ENERGY.Voltage.0",
+        l2_voltage_json="StatusSNS.ENERGY.Voltage.1",
+        l3_voltage_json="StatusSNS.ENERGY.Voltage.2",
+        l1_current_json="StatusSNS.ENERGY.Current.0",
+        l2_current_json="StatusSNS.ENERGY.Current.1",
+        l3_current_json="StatusSNS.ENERGY.Current.2",
+        l1_freq_json="StatusSNS.ENERGY.Frequency",
+        l1_total_act_energy_json="StatusSNS.ENERGY.Total",
+        field_scales="l1_total_act_energy=1000",
+    )
+
+    now = datetime(2024, 1, 2, 0, 0, tzinfo=timezone.utc)
+    payloads = build_dynamic_payloads(source, now, settings, device_mac="ABCDEF123456")
+    em_status = payloads["EM.GetStatus"]
+    emdata_status = payloads["EMData.GetStatus"]
+
+    for spec in FIELDS:
+        target = em_status if spec.method == "EM.GetStatus" else emdata_status
+        assert spec.target in target
+    assert em_status["a_aprt_power"] == pytest.approx(230.0)
+    assert em_status["a_pf"] == pytest.approx(1.0)
+    assert em_status["b_pf"] == pytest.approx(-1.0)
+    assert em_status["c_pf"] == pytest.approx(0.0)
+    assert em_status["a_freq"] == pytest.approx(50.0)
+    assert em_status["b_freq"] == pytest.approx(0.0)
+    assert em_status["total_act_power"] == pytest.approx(115.0)
+    assert em_status["total_current"] == pytest.approx(1.5)
+    assert emdata_status["total_act"] == pytest.approx(12345.0)
+    assert payloads["Shelly.GetStatus"]["emdata:0"] == emdata_status
+
+
+def test_field_scales_and_offsets_apply_to_source_values():
+    source = {"ENERGY": {"Power": 100.0, "Voltage": 231.0, "Total": 1.5}}
+    settings = Settings(
+        provider_endpoint="http://example",
+        poll_interval_ms=1000,
+        l1_act_power_json="ENERGY.Power",
+        l1_voltage_json="ENERGY.Voltage",
+        l1_total_act_energy_json="ENERGY.Total",
+        l2_total_act_energy_value=200.0,
+        field_scales="l1_total_act_energy=1000, l2_total_act_energy=1000",
+        field_offsets="l1_voltage=-1.5, l1_act_power=5",
+        l1_power_offset=-20.0,
+    )
+
+    now = datetime(2024, 1, 2, 0, 0, tzinfo=timezone.utc)
+    payloads = build_dynamic_payloads(source, now, settings, device_mac="ABCDEF123456")
+
+    assert payloads["EM.GetStatus"]["a_voltage"] == pytest.approx(229.5)
+    assert payloads["EM.GetStatus"]["a_act_power"] == pytest.approx(80.0)
+    assert payloads["EMData.GetStatus"]["a_total_act_energy"] == pytest.approx(1500.0)
+    assert payloads["EMData.GetStatus"]["b_total_act_energy"] == pytest.approx(200.0)
+
+
+def test_invalid_field_factors_are_rejected():
+    for spec in ("l1_power=2", "l1_voltage", "l1_voltage=abc"):
+        with pytest.raises(ValueError):
+            Settings(
+                provider_endpoint="http://example",
+                poll_interval_ms=1000,
+                field_scales=spec,
+            )
@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+from app.battery_sim import ControlScenario, run_scenario
+
+
+def _steady(transport: str, offset: float = 0.0) -> ControlScenario:
+    return ControlScenario(
+        load=lambda _t: 500.0,
+        pv=lambda _t: 0.0,
+        duration_s=40.0,
+        speed=50.0,
+        power_offset=offset,
+        transport=transport,
+    )
+
+
+@pytest.mark.parametrize("transport", ["http", "ws", "fastpath"])
+def test_battery_regulates_grid_to_zero(transport):
+    report = asyncio.run(run_scenario(_steady(transport)))
+
+    assert report.failed_polls == 0
+    assert report.polls >= 30
+    assert abs(report.settled_grid_w) < 20.0
+    assert report.exported_wh < 0.5
+
+
+def test_power_offset_shifts_the_regulation_target():
+    report = asyncio.run(run_scenario(_steady("http", offset=-50.0)))
+
+    assert report.settled_grid_w == pytest.approx(50.0, abs=20.0)
@@ -17,3 +17,14 @@ def test_set_payloads_and_list_methods():
     assert cache.get_payload("A") == b"one"
     assert cache.get_payload("B") == b"two"
     assert set(cache.list_methods()) == {"A", "B"}
+
+
+def test_version_changes_only_with_payload_bytes():
+    cache.set_payload("A", b"one")
+    version = cache.get_version("A")
+    cache.set_payloads({"A": b"one"})
+    assert cache.get_version("A") == version
+    cache.set_payload("A", b"two")
+    assert cache.get_version("A") != version
+    assert cache.get_etag("A").startswith('"')
+    assert cache.get_etag("B") is None
@@ -6,7 +6,7 @@ import logging
 import pytest
 
 from app import consumer
-from app.consumer import HttpConsumer
+from app.consumer import HttpConsumer, PollingConsumer
 
 
 def test_consumer_logs_timeout_as_warning(caplog, monkeypatch):
@@ -50,3 +50,168 @@ def test_consumer_logs_timeout_as_warning(caplog, monkeypatch):
         asyncio.run(_run())
 
     assert "Failed to fetch provider endpoint (10s timeout)" in caplog.text
+
+
+class _CountingSession:
+    closed = False
+
+    def __init__(self, gate: asyncio.Event) -> None:
+        self.gate = gate
+        self.calls = 0
+        self.status = 200
+
+    def get(self, *args, **kwargs):
+        session = self
+
+        class _Response:
+            status = session.status
+
+            async def __aenter__(self):
+                session.calls += 1
+                await session.gate.wait()
+                return self
+
+            async def __aexit__(self, exc_type, exc, tb):
+                return False
+
+            async def read(self):
+                return b'{"ok":1}'
+
+        return _Response()
+
+    async def close(self):
+        self.closed = True
+
+
+def test_concurrent_refresh_shares_single_fetch():
+    async def _run() -> None:
+        gate = asyncio.Event()
+        session = _CountingSession(gate)
+        updates = []
+
+        async def on_update(snapshot):
+            updates.append(snapshot)
+
+        hc = HttpConsumer("http://example", 1000, None, None)
+        hc._session = session
+        hc._on_update = on_update
+        waiters = [asyncio.create_task(hc.refresh(500)) for _ in range(5)]
+        await asyncio.sleep(0)
+        gate.set()
+        results = await asyncio.gather(*waiters)
+
+        assert session.calls == 1
+        assert len(updates) == 1
+        assert all(result is updates[0] for result in results)
+
+        assert await hc.refresh(500) is updates[0]
+        assert session.calls == 1
+
+    asyncio.run(_run())
+
+
+def test_idle_poller_waits_for_demand(monkeypatch):
+    async def _run() -> None:
+        gate = asyncio.Event()
+        gate.set()
+        session = _CountingSession(gate)
+        monkeypatch.setattr(consumer, "ClientSession", lambda timeout=None: session)
+
+        async def fast_sleep_ms(_duration_ms: int) -> None:
+            await asyncio.sleep(0)
+
+        monkeypatch.setattr(consumer, "_sleep_ms", fast_sleep_ms)
+
+        hc = HttpConsumer("http://example", 1000, None, None, idle_timeout_s=0)
+        hc._last_demand -= 1
+        task = asyncio.create_task(hc.start())
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert session.calls == 0
+
+        hc.note_demand()
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert session.calls >= 1
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(_run())
+
+
+def test_failures_degrade_then_down_and_recover(caplog):
+    async def _run() -> None:
+        gate = asyncio.Event()
+        gate.set()
+        session = _CountingSession(gate)
+        hc = HttpConsumer("http://example", 1000, None, None)
+        hc._session = session
+        session.status = 503
+
+        with caplog.at_level(logging.DEBUG, logger="virtual_meter.poller"):
+            await hc.refresh()
+            assert hc.health is consumer.UpstreamHealth.DEGRADED
+            for _ in range(consumer.DOWN_AFTER_FAILURES):
+                await hc.refresh()
+        assert hc.health is consumer.UpstreamHealth.DOWN
+        warnings = [r for r in caplog.records if r.levelno == logging.WARNING]
+        assert len(warnings) == 2
+        assert "HTTP 503" in warnings[0].getMessage()
+        assert "marked down" in warnings[1].getMessage()
+
+        session.status = 200
+        with caplog.at_level(logging.INFO, logger="virtual_meter.poller"):
+            await hc.refresh()
+        assert hc.health is consumer.UpstreamHealth.HEALTHY
+        assert hc.failures == 0
+        assert "Provider recovered" in caplog.text
+
+    asyncio.run(_run())
+
+
+def test_next_delay_backs_off_with_jitter_and_cap():
+    hc = HttpConsumer("http://example", 1000, None, None)
+    assert hc.next_delay_ms() == 1000
+    hc.failures = 3
+    for _ in range(20):
+        assert 2000 <= hc.next_delay_ms() <= 4000
+    hc.failures = 30
+    assert hc.next_delay_ms() <= consumer.BACKOFF_MAX_MS
+
+
+def test_polling_consumer_requires_fetch():
+    class NoFetch(PollingConsumer):
+        pass
+
+    with pytest.raises(TypeError, match="_fetch"):
+        NoFetch(1000)
+
+
+def test_poller_keeps_running_after_unexpected_fetch_errors(monkeypatch):
+    class Broken(PollingConsumer):
+        calls = 0
+
+        async def _fetch(self):
+            Broken.calls += 1
+            raise IndexError("bug")
+
+    async def fast_sleep_ms(_duration_ms: int) -> None:
+        await asyncio.sleep(0)
+
+    monkeypatch.setattr(consumer, "_sleep_ms", fast_sleep_ms)
+
+    async def _run() -> None:
+        poller = Broken(1000)
+        task = asyncio.create_task(poller.start())
+        for _ in range(20):
+            await asyncio.sleep(0)
+        assert not task.done()
+        assert Broken.calls >= 3
+        assert poller.health is consumer.UpstreamHealth.DOWN
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(_run())
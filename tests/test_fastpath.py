@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import aiohttp
+from aiohttp import web
+
+from app import cache
+from app.config import Settings
+from app.fastpath import FastPathSite
+from app.provider import create_app
+from app.serializer import encode
+
+DEVICE_ID = "shellypro3em-abcdef123456"
+
+
+async def _start_site() -> tuple[web.AppRunner, int]:
+    settings = Settings(provider_endpoint="http://example", poll_interval_ms=1000)
+    runner = web.AppRunner(create_app(settings, DEVICE_ID))
+    await runner.setup()
+    site = FastPathSite(runner, DEVICE_ID, "127.0.0.1", 0)
+    await site.start()
+    return runner, site.port
+
+
+async def _raw_exchange(port: int, request: bytes) -> bytes:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(request)
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    return data
+
+
+def setup_function():
+    cache._payloads.clear()
+
+
+def test_fast_path_serves_cached_rpc_with_keep_alive():
+    async def _run() -> None:
+        cache.set_payload("EM.GetStatus", encode({"id": 0, "a_act_power": 1.5}))
+        runner, port = await _start_site()
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        request = b"GET /rpc?method=EM.GetStatus HTTP/1.1\r\nHost: x\r\n\r\n"
+        for expected_power in (1.5, 2.5):
+            writer.write(request)
+            head = await reader.readuntil(b"\r\n\r\n")
+            assert head.startswith(b"HTTP/1.1 200 OK\r\n")
+            assert b"Server: ShellyHTTP/1.0.0\r\n" in head
+            length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+            body = json.loads(await reader.readexactly(length))
+            assert body["src"] == DEVICE_ID
+            assert body["result"]["a_act_power"] == expected_power
+            cache.set_payload("EM.GetStatus", encode({"id": 0, "a_act_power": 2.5}))
+        writer.close()
+        await runner.cleanup()
+
+    asyncio.run(_run())
+
+
+def test_fast_path_matches_aiohttp_body():
+    async def _run() -> None:
+        cache.set_payload("Shelly.GetDeviceInfo", encode({"id": DEVICE_ID}))
+        runner, port = await _start_site()
+        fast = await _raw_exchange(
+            port, b"GET /shelly HTTP/1.1\r\nConnection: close\r\n\r\n"
+        )
+        assert fast.split(b"\r\n\r\n", 1)[1] == encode({"id": DEVICE_ID})
+        await runner.cleanup()
+
+    asyncio.run(_run())
+
+
+def test_fast_path_hands_off_other_requests_to_aiohttp():
+    async def _run() -> None:
+        cache.set_payload("EM.GetStatus", encode({"id": 0}))
+        runner, port = await _start_site()
+        async with aiohttp.ClientSession() as session:
+            url = f"http://127.0.0.1:{port}/rpc"
+            async with session.get(url, params={"method": "Nope"}) as resp:
+                body = await resp.json()
+                assert body["error"]["code"] == -32601
+            async with session.post(
+                url, json={"id": 7, "method": "EM.GetStatus"}
+            ) as resp:
+                body = await resp.json()
+                assert body["id"] == 7
+                assert body["result"] == {"id": 0}
+            async with session.ws_connect(url) as ws:
+                await ws.send_str(json.dumps({"id": 3, "method": "EM.GetStatus"}))
+                reply = json.loads(await ws.receive_bytes())
+                assert reply["id"] == 3
+        await runner.cleanup()
+
+    asyncio.run(_run())
+
+
+def test_fast_path_answers_conditional_gets_and_hands_off_long_polls():
+    async def _run() -> None:
+        cache.set_payload("EM.GetStatus", encode({"id": 0}))
+        etag = cache.get_etag("EM.GetStatus")
+        runner, port = await _start_site()
+        response = await _raw_exchange(
+            port,
+            b"GET /rpc?method=EM.GetStatus HTTP/1.1\r\nHost: x\r\n"
+            b"If-None-Match: " + etag.encode() + b"\r\nConnection: close\r\n\r\n",
+        )
+        assert response.startswith(b"HTTP/1.1 304 Not Modified\r\n")
+        assert b"ETag: " + etag.encode() + b"\r\n" in response
+        assert response.endswith(b"\r\n\r\n")
+        async with aiohttp.ClientSession() as session:
+            url = f"http://127.0.0.1:{port}/rpc"
+            params = {"method": "EM.GetStatus", "wait": "0.05"}
+            headers = {"If-None-Match": etag}
+            started = asyncio.get_running_loop().time()
+            async with session.get(url, params=params, headers=headers) as resp:
+                assert resp.status == 304
+                assert resp.headers["ETag"] == etag
+            assert asyncio.get_running_loop().time() - started >= 0.04
+        await runner.cleanup()
+
+    asyncio.run(_run())
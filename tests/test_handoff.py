@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+from app import cache
+from app.config import Settings
+from app.handoff import HandoffServer, bind_listener, reusable_sockets, take_over
+from app.provider import create_app
+from app.serializer import encode
+
+SETTINGS = Settings(provider_endpoint="http://example", poll_interval_ms=1000)
+
+
+async def _serve(device_id: str, sock) -> web.AppRunner:
+    runner = web.AppRunner(create_app(SETTINGS, device_id), shutdown_timeout=1.0)
+    await runner.setup()
+    await web.SockSite(runner, sock).start()
+    return runner
+
+
+def test_handoff_transfers_sockets_and_cache_without_a_gap(tmp_path):
+    async def _run() -> None:
+        cache._payloads.clear()
+        cache.set_payload("EM.GetStatus", encode({"id": 0, "a_act_power": 1.0}))
+        path = str(tmp_path / "handoff.sock")
+        listener = bind_listener("127.0.0.1", 0)
+        url = f"http://127.0.0.1:{listener.getsockname()[1]}/rpc?method=EM.GetStatus"
+        loop = asyncio.get_running_loop()
+        old_runner = await _serve("old", listener)
+        drain = asyncio.Event()
+        server = HandoffServer(
+            {"http": listener}, lambda: loop.call_soon_threadsafe(drain.set), path
+        )
+        server.start()
+
+        served: list[tuple[float, str]] = []
+        failures = 0
+        running = True
+
+        async def _battery() -> None:
+            nonlocal failures
+            connector = aiohttp.TCPConnector(force_close=True)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                while running:
+                    try:
+                        async with session.get(url) as resp:
+                            body = await resp.json()
+                        served.append((loop.time(), body["src"]))
+                    except aiohttp.ClientError:
+                        failures += 1
+                    await asyncio.sleep(0.002)
+
+        battery = asyncio.create_task(_battery())
+        await asyncio.sleep(0.1)
+        predecessor = await asyncio.to_thread(take_over, path)
+        assert predecessor is not None
+        assert predecessor.payloads == cache.snapshot_payloads()
+        new_runner = await _serve("new", predecessor.sockets["http"])
+        predecessor.confirm()
+        await asyncio.wait_for(drain.wait(), 5)
+        await old_runner.cleanup()
+        await asyncio.sleep(0.1)
+        running = False
+        await battery
+        await server.stop()
+        await new_runner.cleanup()
+
+        assert server.handed_off
+        assert failures == 0
+        sources = [src for _, src in served]
+        assert sources[0] == "old" and sources[-1] == "new"
+        times = [at for at, _ in served]
+        gap = max(later - earlier for earlier, later in zip(times, times[1:]))
+        assert gap < 0.25
+
+    asyncio.run(_run())
+
+
+def test_take_over_without_predecessor_returns_none(tmp_path):
+    assert take_over(str(tmp_path / "missing.sock"), timeout_s=0.1) is None
+
+
+def test_reusable_sockets_closes_sockets_on_changed_ports():
+    http = bind_listener("127.0.0.1", 0)
+    modbus = bind_listener("127.0.0.1", 0)
+
+    kept = reusable_sockets(
+        {"http": http, "modbus": modbus},
+        {"http": http.getsockname()[1], "modbus": modbus.getsockname()[1] + 1},
+    )
+
+    assert kept == {"http": http}
+    assert modbus.fileno() == -1
+    http.close()
+
+
+def test_reusable_sockets_closes_sockets_of_disabled_listeners():
+    modbus = bind_listener("127.0.0.1", 0)
+
+    assert reusable_sockets({"modbus": modbus}, {"http": 8080}) == {}
+    assert modbus.fileno() == -1
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.config import Settings
+from app.history import KEYS, EnergyHistory
+from app.provider import create_app
+
+
+def _payloads(power: float) -> dict[str, dict[str, float]]:
+    return {
+        "EM.GetStatus": {"a_act_power": power, "a_voltage": 230.0},
+        "EMData.GetStatus": {"a_total_act_energy": power * 10},
+    }
+
+
+def _filled(capacity: int, timestamps: list[int]) -> EnergyHistory:
+    history = EnergyHistory(capacity)
+    for ts in timestamps:
+        history.append_payloads(ts, _payloads(float(ts)))
+    return history
+
+
+def test_ring_store_wraps_and_answers_range_queries():
+    history = _filled(4, [100, 101, 102, 105, 106, 107])
+    power = KEYS.index("a_avg_act_power")
+
+    result = history.get_data()
+    assert len(history) == 4
+    assert [(block["ts"], len(block["values"])) for block in result["data"]] == [
+        (102, 1),
+        (105, 3),
+    ]
+    assert result["data"][1]["values"][2][power] == 107.0
+
+    ranged = history.get_data(ts=103, end_ts=106)
+    assert [row[power] for row in ranged["data"][0]["values"]] == [105.0, 106.0]
+    assert "next_record_ts" not in ranged
+
+    paged = history.get_data(ts=0, limit=2)
+    assert paged["next_record_ts"] == 106
+
+
+def test_same_second_updates_and_clock_jump_clears():
+    history = _filled(8, [10, 11, 11])
+    assert len(history) == 2
+    assert history.get_data()["data"][0]["values"][-1][KEYS.index("a_avg_voltage")]
+
+    history.append_payloads(5, _payloads(5.0))
+    assert len(history) == 1
+    assert history.get_data()["data"][0]["ts"] == 5
+
+
+def test_csv_export_streams_in_chunks_across_appends():
+    history = _filled(16, list(range(1000, 1005)))
+    chunks = history.iter_csv(ts=1001, chunk_records=2)
+
+    header = next(chunks).decode()
+    assert header.startswith("timestamp,a_total_act_energy,")
+    first = next(chunks).decode().splitlines()
+    history.append_payloads(1005, _payloads(1005.0))
+    rest = b"".join(chunks).decode().splitlines()
+
+    assert [line.split(",")[0] for line in first + rest] == [
+        "1001",
+        "1002",
+        "1003",
+        "1004",
+        "1005",
+    ]
+
+
+def test_provider_serves_getdata_and_csv():
+    async def _run() -> None:
+        history = _filled(16, [200, 201, 202])
+        settings = Settings(provider_endpoint="http://example", poll_interval_ms=1000)
+        client = TestClient(
+            TestServer(create_app(settings, "shellypro3em-test", history=history))
+        )
+        await client.start_server()
+        try:
+            resp = await client.get(
+                "/rpc", params={"method": "EMData.GetData", "ts": "201"}
+            )
+            result = json.loads(await resp.text())["result"]
+            assert result["data"][0]["ts"] == 201
+            assert len(result["data"][0]["values"]) == 2
+
+            resp = await client.post(
+                "/rpc",
+                json={
+                    "id": 7,
+                    "method": "EMData.GetData",
+                    "params": {"id": 0, "ts": "soon"},
+                },
+            )
+            body = json.loads(await resp.text())
+            assert body["id"] == 7
+            assert body["error"]["code"] == -103
+
+            resp = await client.get("/emdata/0/data.csv", params={"end_ts": "201"})
+            assert resp.headers["Transfer-Encoding"] == "chunked"
+            lines = (await resp.text()).splitlines()
+            assert [line.split(",")[0] for line in lines] == ["timestamp", "200", "201"]
+        finally:
+            await client.close()
+
+    asyncio.run(_run())
+
+
+def test_records_are_aligned_to_the_period():
+    history = EnergyHistory(8, period_s=3)
+    for ts in (100, 101, 103, 105, 107, 110):
+        history.append_payloads(ts, _payloads(float(ts)))
+
+    blocks = history.get_data()["data"]
+
+    assert len(history) == 4
+    assert [(block["ts"], len(block["values"])) for block in blocks] == [(99, 4)]
+    power = KEYS.index("a_avg_act_power")
+    values = [row[power] for row in blocks[0]["values"]]
+    assert values == [100.5, 103.0, 106.0, 110.0]
+
+
+def test_records_hold_period_means_and_energy_deltas():
+    history = EnergyHistory(8, period_s=10)
+    for ts, power in ((100, 100.0), (103, 200.0), (106, 300.0), (110, 400.0)):
+        history.append_payloads(ts, _payloads(power))
+    history.append_payloads(111, _payloads(500.0))
+
+    values = history.get_data()["data"][0]["values"]
+    power = KEYS.index("a_avg_act_power")
+    energy = KEYS.index("a_total_act_energy")
+
+    assert [row[power] for row in values] == [200.0, 450.0]
+    # Counters run 1000 -> 3000 in the first period and on to 5000 in the second.
+    assert [row[energy] for row in values] == [2000.0, 2000.0]
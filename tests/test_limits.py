@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from app import cache, metrics
+from app.config import Settings
+from app.fastpath import FastPathSite
+from app.limits import RequestLimiter, create_limiter
+from app.provider import create_app
+from app.serializer import encode
+
+DEVICE_ID = "shellypro3em-abcdef123456"
+SETTINGS = Settings(provider_endpoint="http://example", poll_interval_ms=1000)
+
+
+def test_token_bucket_refills_and_exempts_priority_clients():
+    now = [0.0]
+    limiter = RequestLimiter(2.0, 2, priority=["10.0.0.5"], clock=lambda: now[0])
+    rejected = metrics.get("requests_rejected")
+
+    assert [limiter.allow("10.0.0.9") for _ in range(3)] == [True, True, False]
+    assert all(limiter.allow("10.0.0.5") for _ in range(10))
+    now[0] = 0.5
+    assert limiter.allow("10.0.0.9")
+    assert not limiter.allow("10.0.0.9")
+    assert metrics.get("requests_rejected") - rejected == 2
+
+
+def test_create_limiter_reads_settings():
+    assert create_limiter(SETTINGS) is None
+    limiter = create_limiter(
+        SETTINGS.model_copy(
+            update={"rate_limit_per_s": 5.0, "priority_clients": " 10.0.0.5, ::1 "}
+        )
+    )
+    assert limiter is not None
+    assert limiter.priority == {"10.0.0.5", "::1"}
+
+
+def test_http_and_websocket_requests_are_rate_limited():
+    async def _run() -> None:
+        cache._payloads.clear()
+        cache.set_payload("EM.GetStatus", encode({"id": 0}))
+        limiter = RequestLimiter(0.001, 2)
+        app = create_app(SETTINGS, DEVICE_ID, limiter=limiter)
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        try:
+            statuses = []
+            for _ in range(3):
+                resp = await client.get("/rpc", params={"method": "EM.GetStatus"})
+                statuses.append(resp.status)
+            assert statuses == [200, 200, 429]
+            assert resp.headers["Retry-After"] == "1"
+
+            limiter._buckets.clear()
+            ws = await client.ws_connect("/rpc")
+            replies = []
+            for request_id in (1, 2, 3):
+                message = {"id": request_id, "method": "EM.GetStatus"}
+                await ws.send_str(json.dumps(message))
+                replies.append(json.loads((await ws.receive()).data))
+            await ws.close()
+            assert "result" in replies[0]
+            assert replies[-1]["error"]["code"] == 429
+        finally:
+            await client.close()
+
+    asyncio.run(_run())
+
+
+def test_requests_above_concurrency_ceiling_are_shed_except_priority():
+    async def _run() -> None:
+        cache._payloads.clear()
+        cache.set_payload("EM.GetStatus", encode({"id": 0}))
+        gate = asyncio.Event()
+
+        async def on_demand(_method: str) -> None:
+            await gate.wait()
+
+        limiter = RequestLimiter(0, 1, max_concurrent=1)
+        app = create_app(SETTINGS, DEVICE_ID, on_demand, limiter=limiter)
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        shed = metrics.get("requests_shed")
+        try:
+            params = {"method": "EM.GetStatus"}
+            first = asyncio.create_task(client.get("/rpc", params=params))
+            while limiter.inflight == 0:
+                await asyncio.sleep(0.01)
+            resp = await client.get("/rpc", params=params)
+            assert resp.status == 503
+
+            limiter.priority = frozenset({"127.0.0.1"})
+            second = asyncio.create_task(client.get("/rpc", params=params))
+            gate.set()
+            assert (await first).status == 200
+            assert (await second).status == 200
+            assert metrics.get("requests_shed") - shed == 1
+            assert limiter.inflight == 0
+        finally:
+            await client.close()
+
+    asyncio.run(_run())
+
+
+def test_fast_path_answers_over_rate_requests_with_prebuilt_429():
+    async def _run() -> None:
+        cache._payloads.clear()
+        cache.set_payload("EM.GetStatus", encode({"id": 0}))
+        limiter = RequestLimiter(0.001, 1)
+        runner = web.AppRunner(create_app(SETTINGS, DEVICE_ID, limiter=limiter))
+        await runner.setup()
+        site = FastPathSite(runner, DEVICE_ID, "127.0.0.1", 0, limiter=limiter)
+        await site.start()
+        reader, writer = await asyncio.open_connection("127.0.0.1", site.port)
+        served = metrics.get("rpc_requests")
+        try:
+            request = b"GET /rpc?method=EM.GetStatus HTTP/1.1\r\nHost: x\r\n\r\n"
+            writer.write(request)
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+            await reader.readexactly(length)
+            assert head.startswith(b"HTTP/1.1 200 OK")
+            writer.write(request)
+            head = await reader.readuntil(b"\r\n\r\n")
+            assert head.startswith(b"HTTP/1.1 429 Too Many Requests")
+            assert metrics.get("rpc_requests") - served == 1
+        finally:
+            writer.close()
+            await runner.cleanup()
+
+    asyncio.run(_run())
+
+
+def test_parked_long_polls_do_not_hold_concurrency_slots():
+    async def _run() -> None:
+        cache._payloads.clear()
+        cache.set_payload("EM.GetStatus", encode({"id": 0, "a_act_power": 1.0}))
+        limiter = RequestLimiter(0, 1, max_concurrent=1)
+        app = create_app(SETTINGS, DEVICE_ID, limiter=limiter)
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        shed = metrics.get("requests_shed")
+        try:
+            params = {"method": "EM.GetStatus"}
+            polls = [
+                asyncio.create_task(client.get("/rpc", params={**params, "wait": "5"}))
+                for _ in range(3)
+            ]
+            while len(cache._waiters.get("EM.GetStatus", ())) < 3:
+                await asyncio.sleep(0.01)
+            assert limiter.inflight == 0
+            resp = await client.get("/rpc", params=params)
+            assert resp.status == 200
+
+            cache.set_payload("EM.GetStatus", encode({"id": 0, "a_act_power": 2.0}))
+            for poll in polls:
+                resp = await poll
+                assert resp.status == 200
+                assert (await resp.json())["result"]["a_act_power"] == 2.0
+            assert metrics.get("requests_shed") == shed
+            assert limiter.inflight == 0
+        finally:
+            await client.close()
+
+    asyncio.run(_run())
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+import json
+from pathlib import Path
+import subprocess
+import sys
+
+from app.config import Settings
+from app.consumer import ConsumerSnapshot
+from app.main import create_snapshot_handler
+from app.profiling import measure_tick_allocations
+
+TICK_PEAK_BUDGET_BYTES = 32 * 1024
+TICK_RETAINED_BUDGET_BYTES = 512
+
+RAW = json.dumps(
+    {
+        "StatusSNS": {
+            "ENERGY": {
+                "Power": [512, -143, 87],
+                "Voltage": [231.2, 229.8, 230.4],
+                "Current": [2.291, 0.696, 0.412],
+                "Total": [1234.567, 987.654, 456.789],
+            }
+        }
+    }
+).encode("utf-8")
+
+
+def test_pipeline_tick_allocations_stay_within_budget():
+    options: dict[str, object] = {
+        "provider_endpoint": "http://example",
+        "poll_interval_ms": 1000,
+    }
+    for index, phase in enumerate(("l1", "l2", "l3")):
+        for field, key in (
+            ("act_power", "Power"),
+            ("voltage", "Voltage"),
+            ("current", "Current"),
+            ("total_act_energy", "Total"),
+        ):
+            options[f"{phase}_{field}_json"] = f"StatusSNS.ENERGY.{key}.{index}"
+    options["field_scales"] = ", ".join(
+        f"{phase}_total_act_energy=1000" for phase in ("l1", "l2", "l3")
+    )
+    handle = create_snapshot_handler(Settings(**options), "AABBCCDDEEFF")
+
+    async def _tick() -> None:
+        await handle(ConsumerSnapshot(raw=RAW, fetched_at=datetime.now(timezone.utc)))
+
+    report = asyncio.run(measure_tick_allocations(_tick, ticks=200))
+
+    assert report["peak_bytes"] < TICK_PEAK_BUDGET_BYTES
+    assert report["retained_bytes"] < TICK_RETAINED_BUDGET_BYTES
+
+
+def test_optional_subsystems_are_not_imported_by_default():
+    app_root = Path(__file__).resolve().parents[1] / "virtual-meter"
+    optional = [
+        "app.fastpath",
+        "app.handoff",
+        "app.modbus",
+        "app.recorder",
+        "cProfile",
+        "resource",
+        "tracemalloc",
+    ]
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, app.main; "
+            f"print([name for name in {optional!r} if name in sys.modules])",
+        ],
+        cwd=app_root,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+import json
+import struct
+
+import pytest
+
+from app import cache
+from app.config import Settings
+from app.consumer import ConsumerSnapshot, PollingConsumer, UpstreamHealth
+from app.main import create_consumer, create_modbus_server, create_snapshot_handler
+from app.modbus import (
+    ModbusConsumer,
+    ModbusRegisters,
+    ModbusServer,
+    parse_register_map,
+)
+
+NOW = datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+
+def _decode_float(data: bytes) -> float:
+    low, high = struct.unpack(">HH", data)
+    return struct.unpack(">f", struct.pack(">HH", high, low))[0]
+
+
+async def _read(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    function: int,
+    address: int,
+    count: int,
+    transaction: int = 1,
+) -> tuple[int, bytes]:
+    writer.write(
+        struct.pack(">HHHBBHH", transaction, 0, 6, 1, function, address, count)
+    )
+    await writer.drain()
+    header = await reader.readexactly(7)
+    echoed, protocol, length, unit = struct.unpack(">HHHB", header)
+    assert (echoed, protocol, unit) == (transaction, 0, 1)
+    pdu = await reader.readexactly(length - 1)
+    return pdu[0], pdu[1:]
+
+
+def test_registers_pack_assembled_payloads():
+    registers = ModbusRegisters()
+    registers.update(
+        {
+            "EM.GetStatus": {"a_voltage": 230.5, "total_act_power": -120.0},
+            "EMData.GetStatus": {"total_act": 1234.5},
+        },
+        NOW,
+    )
+
+    assert _decode_float(registers.read(31020, 2)) == 230.5
+    assert _decode_float(registers.read(31013, 2)) == -120.0
+    assert _decode_float(registers.read(31162, 2)) == 1234.5
+    assert struct.unpack(">I", registers.read(31000, 2))[0] == int(NOW.timestamp())
+    assert registers.read(31179, 1) == b"\x00\x00"
+    assert registers.read(31179, 2) is None
+    assert registers.read(30999, 1) is None
+
+
+def test_server_answers_local_modbus_client():
+    async def _run() -> None:
+        registers = ModbusRegisters()
+        registers.update({"EM.GetStatus": {"a_act_power": 250.0}}, NOW)
+        server = ModbusServer(registers, host="127.0.0.1", port=0)
+        await server.start()
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        try:
+            function, data = await _read(reader, writer, 4, 31020, 10)
+            assert function == 4
+            assert data[0] == 20
+            assert _decode_float(data[9:13]) == 250.0
+
+            registers.update({"EM.GetStatus": {"a_act_power": 300.0}}, NOW)
+            function, data = await _read(reader, writer, 3, 31024, 2, transaction=2)
+            assert function == 3
+            assert _decode_float(data[1:]) == 300.0
+
+            function, data = await _read(reader, writer, 4, 40000, 2)
+            assert (function, data) == (0x84, b"\x02")
+            function, data = await _read(reader, writer, 6, 31000, 1)
+            assert (function, data) == (0x86, b"\x01")
+        finally:
+            writer.close()
+            await server.stop()
+
+    asyncio.run(_run())
+
+
+def test_snapshot_handler_refreshes_registers():
+    async def _run() -> None:
+        registers = ModbusRegisters()
+        settings = Settings(
+            provider_endpoint="http://example",
+            poll_interval_ms=1000,
+            l1_act_power_json="ENERGY.Power",
+        )
+        handle = create_snapshot_handler(settings, "AABBCCDDEEFF", registers)
+        snapshot = ConsumerSnapshot(raw=b'{"ENERGY": {"Power": 42}}', fetched_at=NOW)
+        await handle(snapshot)
+        assert _decode_float(registers.read(31024, 2)) == 42.0
+
+    asyncio.run(_run())
+
+
+def _sdm630_registers(values: dict[int, float]) -> ModbusRegisters:
+    registers = ModbusRegisters(base=0, count=80)
+    image = bytearray(registers.image)
+    for address, value in values.items():
+        struct.pack_into(">f", image, address * 2, value)
+    registers.image = bytes(image)
+    return registers
+
+
+def test_parse_register_map_presets_and_custom_lists():
+    assert parse_register_map("SDM630")["l2_act_power"] == 14
+    assert parse_register_map("l1_act_power=0x10, l1_voltage=0") == {
+        "l1_act_power": 16,
+        "l1_voltage": 0,
+    }
+    with pytest.raises(ValueError):
+        parse_register_map("l1_power=12")
+    with pytest.raises(ValueError):
+        parse_register_map("l1_voltage=65536")
+    with pytest.raises(ValueError):
+        ModbusConsumer("127.0.0.1", 502, 1, {"l1_voltage": 0, "l2_voltage": 200}, 1000)
+    with pytest.raises(ValueError):
+        ModbusConsumer("127.0.0.1", 502, 1, {"l1_voltage": 65535}, 1000)
+    with pytest.raises(ValueError, match="provider_modbus_host"):
+        Settings(provider_endpoint="", poll_interval_ms=1000, provider_type="modbus")
+
+
+def test_modbus_consumer_reads_block_into_readings():
+    async def _run() -> None:
+        registers = _sdm630_registers({0: 231.5, 12: -480.0, 14: 120.0, 70: 50.0})
+        server = ModbusServer(registers, host="127.0.0.1", port=0)
+        await server.start()
+        settings = Settings(
+            provider_endpoint="",
+            poll_interval_ms=1000,
+            provider_type="modbus",
+            provider_modbus_host="127.0.0.1",
+            provider_modbus_port=server.port,
+        )
+        consumer = create_consumer(settings)
+        assert isinstance(consumer, ModbusConsumer)
+        handle = create_snapshot_handler(settings, "AABBCCDDEEFF")
+        consumer._on_update = handle
+        try:
+            snapshot = await consumer.refresh()
+            assert snapshot is not None
+            assert snapshot.readings["l1_voltage"] == 231.5
+            assert snapshot.readings["l3_freq"] == 50.0
+            em_status = json.loads(cache.get_payload("EM.GetStatus"))
+            assert em_status["a_act_power"] == -480.0
+            assert em_status["total_act_power"] == -360.0
+
+            await server.stop()
+            consumer.fetch_timeout_s = consumer.probe_timeout_s = 0.5
+            await consumer.refresh()
+            assert consumer.health is UpstreamHealth.DEGRADED
+            assert consumer.latest is snapshot
+        finally:
+            await consumer.stop()
+            await server.stop()
+
+    asyncio.run(_run())
+
+
+class _CountingConsumer(PollingConsumer):
+    def __init__(self, idle_timeout_s: float) -> None:
+        super().__init__(10, idle_timeout_s=idle_timeout_s)
+        self.fetches = 0
+
+    async def _fetch(self) -> ConsumerSnapshot | None:
+        self.fetches += 1
+        return None
+
+
+def test_modbus_reads_keep_on_demand_poller_running_and_fail_while_down():
+    async def _run() -> None:
+        settings = Settings(
+            provider_endpoint="http://example",
+            poll_interval_ms=10,
+            on_demand=True,
+            modbus_server=True,
+            modbus_port=0,
+        )
+        consumer = _CountingConsumer(idle_timeout_s=0.05)
+        server = create_modbus_server(settings, consumer)
+        await server.start()
+        poller = asyncio.create_task(consumer.start())
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        try:
+            await asyncio.sleep(0.15)
+            assert consumer._is_idle()
+            idle_fetches = consumer.fetches
+
+            for transaction in range(10):
+                function, _ = await _read(reader, writer, 4, 31000, 2, transaction)
+                assert function == 4
+                await asyncio.sleep(0.02)
+            assert not consumer._is_idle()
+            assert consumer.fetches > idle_fetches
+
+            consumer.health = UpstreamHealth.DOWN
+            function, data = await _read(reader, writer, 4, 31000, 2)
+            assert (function, data) == (0x84, b"\x04")
+        finally:
+            writer.close()
+            poller.cancel()
+            await asyncio.gather(poller, return_exceptions=True)
+            await server.stop()
+
+    asyncio.run(_run())
+
+
+@pytest.mark.parametrize(
+    "reply",
+    [
+        b"\x00\x01\x00\x00\x00\x01\x01",  # MBAP length 1: empty PDU
+        b"\x00\x01\x00\x00\x00\x02\x01\x84",  # exception code cut off
+        b"\x00\x01\x00\x00\x00\x00\x01",  # MBAP length 0
+    ],
+)
+def test_modbus_consumer_survives_malformed_responses(reply):
+    async def _run() -> None:
+        async def _answer(reader, writer) -> None:
+            await reader.readexactly(12)
+            writer.write(reply)
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(_answer, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        consumer = ModbusConsumer("127.0.0.1", port, 1, {"l1_voltage": 0}, 1000)
+        try:
+            assert await consumer.refresh() is None
+            assert consumer.health is UpstreamHealth.DEGRADED
+            assert consumer._writer is None
+        finally:
+            await consumer.stop()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(_run())
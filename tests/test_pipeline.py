@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+import json
+import threading
+
+import pytest
+
+from app import cache, metrics
+from app.config import Settings
+from app.consumer import ConsumerSnapshot
+from app.main import create_snapshot_handler
+from app.pipeline import LatestSnapshotStage
+
+
+def _snapshot(power: int) -> ConsumerSnapshot:
+    return ConsumerSnapshot(
+        raw=json.dumps({"ENERGY": {"Power": power}}).encode(),
+        fetched_at=datetime.now(timezone.utc),
+    )
+
+
+def test_stage_processes_latest_and_drops_superseded_snapshots():
+    async def _run() -> None:
+        gate = asyncio.Event()
+        seen: list[bytes] = []
+
+        async def slow_handler(snapshot: ConsumerSnapshot) -> None:
+            seen.append(snapshot.raw)
+            await gate.wait()
+
+        stage = LatestSnapshotStage(slow_handler)
+        dropped = metrics.get("snapshots_dropped")
+        processed = metrics.get("snapshots_processed")
+        task = asyncio.create_task(stage.run())
+        await stage.submit(_snapshot(1))
+        await asyncio.sleep(0)
+        for power in (2, 3, 4):
+            await stage.submit(_snapshot(power))
+        gate.set()
+        await asyncio.wait_for(stage.drain(), 1.0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert seen == [_snapshot(1).raw, _snapshot(4).raw]
+        assert metrics.get("snapshots_dropped") - dropped == 2
+        assert metrics.get("snapshots_processed") - processed == 2
+
+    asyncio.run(_run())
+
+
+def test_stage_survives_handler_errors():
+    async def _run() -> None:
+        calls = 0
+
+        async def failing_handler(_snapshot: ConsumerSnapshot) -> None:
+            nonlocal calls
+            calls += 1
+            raise RuntimeError("boom")
+
+        stage = LatestSnapshotStage(failing_handler)
+        task = asyncio.create_task(stage.run())
+        for power in (1, 2):
+            await stage.submit(_snapshot(power))
+            await asyncio.wait_for(stage.drain(), 1.0)
+        task.cancel()
+        assert calls == 2
+
+    asyncio.run(_run())
+
+
+def test_offloaded_handler_builds_payloads_in_worker_thread(monkeypatch):
+    import app.main as main_module
+
+    threads: list[int] = []
+    original = main_module.build_dynamic_payloads
+
+    def tracking_build(*args, **kwargs):
+        threads.append(threading.get_ident())
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(main_module, "build_dynamic_payloads", tracking_build)
+
+    async def _run() -> None:
+        cache._payloads.clear()
+        settings = Settings(
+            provider_endpoint="http://example",
+            poll_interval_ms=1000,
+            l1_act_power_json="ENERGY.Power",
+        )
+        handle = create_snapshot_handler(settings, "AABBCCDDEEFF", offload=True)
+        await handle(_snapshot(321))
+        status = json.loads(cache.get_payload("EM.GetStatus"))
+        assert status["a_act_power"] == 321.0
+
+    asyncio.run(_run())
+    assert threads and threads[0] != threading.get_ident()
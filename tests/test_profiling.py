@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from app import cache
+from app.config import Settings
+from app.consumer import ConsumerSnapshot
+from app.main import create_snapshot_handler
+from app.profiling import STAGES, TickTimings, tick_timings
+from app.provider import create_app
+
+
+def test_tick_timings_ring_buffer_keeps_latest_ticks():
+    timings = TickTimings(capacity=4)
+    for tick in range(1, 7):
+        timings.record(tuple(tick / 1000.0 for _ in STAGES))
+
+    summary = timings.summary()
+
+    assert summary["ticks"] == 4
+    fetch = summary["stages"]["fetch"]
+    assert fetch["last_ms"] == 6.0
+    assert fetch["max_ms"] == 6.0
+    assert fetch["p50_ms"] == 5.0
+    timings.clear()
+    assert timings.summary()["stages"] == {}
+
+
+def test_snapshot_handler_records_stage_timings_only_when_enabled():
+    async def _run() -> None:
+        cache._payloads.clear()
+        tick_timings.clear()
+        settings = Settings(
+            provider_endpoint="http://example",
+            poll_interval_ms=1000,
+            l1_act_power_json="ENERGY.Power",
+        )
+        handle = create_snapshot_handler(settings, "AABBCCDDEEFF")
+        snapshot = ConsumerSnapshot(
+            raw=b'{"ENERGY": {"Power": 100}}',
+            fetched_at=datetime.now(timezone.utc),
+            fetch_s=0.002,
+        )
+        await handle(snapshot)
+        assert tick_timings.summary()["ticks"] == 0
+
+        tick_timings.enabled = True
+        try:
+            await handle(snapshot)
+        finally:
+            tick_timings.enabled = False
+        summary = tick_timings.summary()
+        assert summary["ticks"] == 1
+        assert set(summary["stages"]) == set(STAGES)
+        assert summary["stages"]["fetch"]["last_ms"] == 2.0
+        tick_timings.clear()
+
+    asyncio.run(_run())
+
+
+def test_admin_endpoints_toggle_ticks_and_capture_profile():
+    async def _run() -> None:
+        settings = Settings(
+            provider_endpoint="http://example",
+            poll_interval_ms=1000,
+            admin_diagnostics=True,
+        )
+        client = TestClient(TestServer(create_app(settings, "shellypro3em-test")))
+        await client.start_server()
+        try:
+            resp = await client.post("/admin/ticks", json={"enabled": True})
+            assert resp.status == 200
+            assert (await resp.json())["enabled"] is True
+            resp = await client.post("/admin/ticks", json={"enabled": "yes"})
+            assert resp.status == 400
+            resp = await client.post("/admin/ticks", json={"enabled": False})
+            assert (await resp.json())["enabled"] is False
+
+            resp = await client.post("/admin/profile?seconds=0.01")
+            assert resp.status == 200
+            assert "function calls" in await resp.text()
+            resp = await client.post("/admin/profile?seconds=abc")
+            assert resp.status == 400
+            resp = await client.post("/admin/profile?seconds=nan")
+            assert resp.status == 400
+            resp = await client.post("/admin/profile?seconds=inf")
+            assert resp.status == 400
+        finally:
+            await client.close()
+
+    asyncio.run(_run())
+
+
+def test_admin_diagnostics_are_not_served_by_default():
+    async def _run() -> None:
+        settings = Settings(provider_endpoint="http://example", poll_interval_ms=1000)
+        client = TestClient(TestServer(create_app(settings, "shellypro3em-test")))
+        await client.start_server()
+        try:
+            resp = await client.post("/admin/ticks", json={"enabled": True})
+            assert resp.status == 404
+            assert (await client.get("/admin/ticks")).status == 404
+            assert (await client.post("/admin/profile?seconds=0.01")).status == 404
+            assert (await client.get("/admin/metrics")).status == 200
+        finally:
+            await client.close()
+        assert tick_timings.enabled is False
+
+    asyncio.run(_run())
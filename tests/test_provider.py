@@ -7,7 +7,8 @@ from aiohttp.test_utils import TestClient, TestServer
 
 from app import cache
 from app.config import Settings
-from app.provider import create_app
+from app.consumer import UpstreamHealth
+from app.provider import UPSTREAM_DOWN_ERROR, create_app
 from app.serializer import encode
 
 
@@ -47,3 +48,94 @@ def test_shelly_endpoint_missing_payload_returns_404():
         await client.close()
 
     asyncio.run(_run())
+
+
+def test_on_demand_hook_runs_before_lookup_and_metrics_report_ratio():
+    async def _run() -> None:
+        cache._payloads.clear()
+        seen = []
+
+        async def on_demand(method: str) -> None:
+            seen.append(method)
+            cache.set_payload(method, encode({"id": 0}))
+
+        settings = Settings(provider_endpoint="http://example", poll_interval_ms=1000)
+        app = create_app(settings, "shellypro3em-abcdef123456", on_demand)
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        resp = await client.get("/rpc", params={"method": "EM.GetStatus"})
+        body = await resp.json()
+        assert body["result"] == {"id": 0}
+        assert seen == ["EM.GetStatus"]
+
+        resp = await client.get("/admin/metrics")
+        report = await resp.json()
+        assert report["counters"]["rpc_requests"] >= 1
+        assert "upstream_fetches_per_request" in report
+        await client.close()
+
+    asyncio.run(_run())
+
+
+def test_dynamic_methods_report_error_while_upstream_down():
+    async def _run() -> None:
+        cache._payloads.clear()
+        cache.set_payload("EM.GetStatus", encode({"id": 0}))
+        cache.set_payload("EM.GetConfig", encode({"id": 0}))
+        health = UpstreamHealth.DOWN
+        settings = Settings(provider_endpoint="http://example", poll_interval_ms=1000)
+        app = create_app(
+            settings, "shellypro3em-abcdef123456", upstream_health=lambda: health
+        )
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        resp = await client.get("/rpc", params={"method": "EM.GetStatus"})
+        body = await resp.json()
+        assert body["error"]["code"] == UPSTREAM_DOWN_ERROR["code"]
+        resp = await client.get("/rpc", params={"method": "EM.GetConfig"})
+        body = await resp.json()
+        assert body["result"] == {"id": 0}
+        await client.close()
+
+    asyncio.run(_run())
+
+
+def test_conditional_get_and_long_poll():
+    async def _run() -> None:
+        cache._payloads.clear()
+        cache.set_payload("EM.GetStatus", encode({"id": 0, "a_act_power": 1.0}))
+        settings = Settings(provider_endpoint="http://example", poll_interval_ms=1000)
+        app = create_app(settings, "shellypro3em-abcdef123456")
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        url = "/rpc?method=EM.GetStatus"
+
+        resp = await client.get(url)
+        etag = resp.headers["ETag"]
+        resp = await client.get(url, headers={"If-None-Match": etag})
+        assert resp.status == 304
+        assert await resp.read() == b""
+
+        cache.set_payload("EM.GetStatus", encode({"id": 0, "a_act_power": 1.0}))
+        resp = await client.get(url, headers={"If-None-Match": etag})
+        assert resp.status == 304
+
+        resp = await client.get(url + "&wait=0.05", headers={"If-None-Match": etag})
+        assert resp.status == 304
+
+        async def _publish() -> None:
+            await asyncio.sleep(0.05)
+            cache.set_payload("EM.GetStatus", encode({"id": 0, "a_act_power": 2.0}))
+
+        publisher = asyncio.create_task(_publish())
+        resp = await client.get(url + "&wait=5", headers={"If-None-Match": etag})
+        await publisher
+        assert resp.status == 200
+        assert resp.headers["ETag"] != etag
+        assert (await resp.json())["result"]["a_act_power"] == 2.0
+
+        resp = await client.get(url + "&wait=soon")
+        assert resp.status == 400
+        await client.close()
+
+    asyncio.run(_run())
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from app import metrics
+from app.consumer import HttpConsumer, UpstreamHealth
+from app.simulator import SimulatorConfig, UpstreamSimulator, constant
+
+
+def _consumer(url: str) -> HttpConsumer:
+    return HttpConsumer(url, 10, None, None, fetch_timeout_s=0.2, probe_timeout_s=0.2)
+
+
+def test_simulator_serves_status10_profile():
+    async def _run() -> None:
+        simulator = UpstreamSimulator(
+            SimulatorConfig(profile=constant(100.0, 200.0, 300.0), phases=3)
+        )
+        url = await simulator.start()
+        hc = _consumer(url)
+        task = asyncio.create_task(hc.start())
+        while hc.latest is None:
+            await asyncio.sleep(0.01)
+        body = json.loads(hc.latest.raw)
+        assert body["StatusSNS"]["ENERGY"]["Power"] == [100.0, 200.0, 300.0]
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await simulator.stop()
+
+    asyncio.run(_run())
+
+
+def test_consumer_recovers_from_injected_faults():
+    async def _run() -> None:
+        simulator = UpstreamSimulator(SimulatorConfig(profile=constant(42.0)))
+        url = await simulator.start()
+        hc = _consumer(url)
+        bodies = []
+
+        async def on_update(snapshot) -> None:
+            bodies.append(json.loads(snapshot.raw))
+
+        task = asyncio.create_task(hc.start(on_update))
+        while not bodies:
+            await asyncio.sleep(0.01)
+        failures_before = metrics.get("upstream_failures")
+
+        simulator.queue_faults("timeout")
+        simulator.queue_faults("truncate")
+        simulator.queue_faults("warning")
+        while (
+            simulator.stats["warning"] == 0 or hc.health is not UpstreamHealth.HEALTHY
+        ):
+            await asyncio.sleep(0.01)
+
+        assert metrics.get("upstream_failures") - failures_before == 2
+        assert simulator.stats["timeout"] == 1
+        assert simulator.stats["truncate"] == 1
+        assert {"WARNING": "Enable weblog 2 if response expected"} in bodies
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await simulator.stop()
+
+    asyncio.run(_run())
@@ -0,0 +1,47 @@
+import asyncio
+import logging
+import time
+
+from app import metrics
+from app.watchdog import LagHistogram, LoopWatchdog
+
+
+def test_lag_histogram_buckets_samples():
+    histogram = LagHistogram()
+    for lag_ms in (0.0, 0.5, 3.0, 120.0, 5000.0):
+        histogram.record(lag_ms)
+
+    summary = histogram.summary()
+
+    assert summary["samples"] == 5
+    assert summary["max_ms"] == 5000.0
+    assert summary["buckets"]["le_1"] == 2
+    assert summary["buckets"]["le_5"] == 1
+    assert summary["buckets"]["le_250"] == 1
+    assert summary["buckets"]["inf"] == 1
+
+
+def _block_the_loop():
+    time.sleep(0.3)
+
+
+def test_watchdog_logs_stack_of_blocking_code(caplog):
+    histogram = LagHistogram()
+    metrics._counters.clear()
+
+    async def _run():
+        watchdog = LoopWatchdog(50, interval_s=0.02, histogram=histogram)
+        watchdog.start()
+        await asyncio.sleep(0.05)
+        _block_the_loop()
+        await asyncio.sleep(0.05)
+        await watchdog.stop()
+
+    with caplog.at_level(logging.WARNING, logger="virtual_meter.watchdog"):
+        asyncio.run(_run())
+
+    stalls = [r for r in caplog.records if "Event loop blocked" in r.getMessage()]
+    assert len(stalls) == 1
+    assert "_block_the_loop" in stalls[0].getMessage()
+    assert metrics.snapshot()["loop_stalls"] == 1
+    assert histogram.max_ms >= 200
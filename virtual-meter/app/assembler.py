@@ -1,23 +1,109 @@
-"""Assemble RPC payloads from source readings."""
+"""Assemble RPC payloads from source readings.
+
+Every mapped reading is described once in ``FIELDS``. For a field keyed
+``l1_voltage`` the settings ``l1_voltage_json`` and ``l1_voltage_value`` supply
+its source, and the spec names the payload key it lands in. ``field_scales``
+converts source units (e.g. kWh to Wh) and ``field_offsets`` shifts any field.
+Settings are compiled into a flat mapping plan once, so a tick only walks JSON
+paths.
+"""
 
 from __future__ import annotations
 
+from dataclasses import dataclass
 from datetime import datetime
 from typing import Any
 
 from .config import Settings
-from .payload_templates import EMDATA_STATUS_TEMPLATE
 
+DYNAMIC_METHODS = frozenset(("Shelly.GetStatus", "EM.GetStatus", "EMData.GetStatus"))
+
+PHASES = (("l1", "a"), ("l2", "b"), ("l3", "c"))
+
+
+@dataclass(frozen=True, slots=True)
+class FieldSpec:
+    """One mapped reading: settings key prefix, target method, payload key."""
+
+    key: str
+    method: str
+    target: str
+    digits: int
+
+
+# (field suffix, decimal digits) per phase, in Shelly payload order.
+EM_PHASE_FIELDS = (
+    ("current", 3),
+    ("voltage", 1),
+    ("act_power", 1),
+    ("aprt_power", 1),
+    ("pf", 2),
+    ("freq", 1),
+)
+EMDATA_PHASE_FIELDS = (
+    ("total_act_energy", 2),
+    ("total_act_ret_energy", 2),
+)
+
+FIELDS: tuple[FieldSpec, ...] = (
+    tuple(
+        FieldSpec(f"{phase}_{suffix}", "EM.GetStatus", f"{letter}_{suffix}", digits)
+        for phase, letter in PHASES
+        for suffix, digits in EM_PHASE_FIELDS
+    )
+    + (FieldSpec("n_current", "EM.GetStatus", "n_current", 3),)
+    + tuple(
+        FieldSpec(f"{phase}_{suffix}", "EMData.GetStatus", f"{letter}_{suffix}", digits)
+        for phase, letter in PHASES
+        for suffix, digits in EMDATA_PHASE_FIELDS
+    )
+)
+
+FIELD_KEYS = frozenset(spec.key for spec in FIELDS)
+
+_FIELDS_BY_METHOD = {
+    method: tuple(spec for spec in FIELDS if spec.method == method)
+    for method in ("EM.GetStatus", "EMData.GetStatus")
+}
+
+# (payload key, per-phase field suffix summed into it, decimal digits)
+EM_TOTALS = (
+    ("total_current", "current", 3),
+    ("total_act_power", "act_power", 1),
+    ("total_aprt_power", "aprt_power", 1),
+)
+EMDATA_TOTALS = (
+    ("total_act", "total_act_energy", 2),
+    ("total_act_ret", "total_act_ret_energy", 2),
+)
 
-def _get_path(data: dict[str, Any], path: str) -> Any:
-    """Traverse a dotted path in a nested mapping."""
+
+@dataclass(frozen=True, slots=True)
+class _Mapping:
+    """A field spec resolved against settings."""
+
+    key: str
+    path: tuple[str | int, ...] | None
+    fixed: float | None
+    scale: float
+    offset: float | None
+
+
+def _split_path(path: str) -> tuple[str | int, ...]:
+    """Split a dotted path; all-digit parts become list indexes."""
+    return tuple(int(part) if part.isdigit() else part for part in path.split("."))
+
+
+def _get_path(data: Any, parts: tuple[str | int, ...]) -> Any:
+    """Traverse pre-split path parts through nested mappings and lists."""
     current: Any = data
-    for part in path.split("."):
-        if not isinstance(current, dict):
+    for part in parts:
+        if isinstance(current, dict):
+            current = current.get(part if isinstance(part, str) else str(part))
+        elif isinstance(current, list) and isinstance(part, int):
+            current = current[part] if part < len(current) else None
+        else:
             return None
-        if part not in current:
-            return None
-        current = current[part]
     return current
 
 
@@ -31,90 +117,144 @@ def _to_float(value: Any) -> float | None:
         return None
 
 
-def _apply_json_values(
-    target: dict[str, float | None],
-    source: dict[str, Any],
-    mappings: dict[str, str | None],
-) -> None:
-    """Apply JSON path mappings into the target values dict."""
-    for key, path in mappings.items():
-        if not path:
-            continue
-        value = _to_float(_get_path(source, path))
-        if value is not None:
-            target[key] = value
+def parse_field_factors(spec: str | None) -> dict[str, float]:
+    """Parse a ``field=number, ...`` list keyed by ``FIELDS`` keys."""
+    factors: dict[str, float] = {}
+    if not spec:
+        return factors
+    for item in spec.split(","):
+        key, separator, number = item.partition("=")
+        key = key.strip()
+        if not separator or key not in FIELD_KEYS:
+            raise ValueError(f"Invalid field factor: {item.strip()!r}")
+        try:
+            factors[key] = float(number)
+        except ValueError:
+            raise ValueError(f"Invalid field factor: {item.strip()!r}") from None
+    return factors
 
 
-def _apply_value_overrides(
-    target: dict[str, float | None], overrides: dict[str, float | None]
-) -> None:
-    """Apply static override values when input is missing."""
-    for key, value in overrides.items():
-        if target.get(key) is None and value is not None:
-            target[key] = value
+def _offsets(settings: Settings) -> dict[str, float]:
+    """Extract per-field offsets; the per-phase power offsets take precedence."""
+    offsets = parse_field_factors(settings.field_offsets)
+    for key, offset in (
+        ("l1_act_power", settings.l1_power_offset),
+        ("l2_act_power", settings.l2_power_offset),
+        ("l3_act_power", settings.l3_power_offset),
+    ):
+        if offset is not None:
+            offsets[key] = offset
+    return offsets
 
 
-def _json_paths(settings: Settings) -> dict[str, str | None]:
-    """Extract JSON path mappings from settings."""
-    return {
-        "l1_act_power": settings.l1_act_power_json,
-        "l2_act_power": settings.l2_act_power_json,
-        "l3_act_power": settings.l3_act_power_json,
-    }
+def _compile(settings: Settings) -> tuple[_Mapping, ...]:
+    """Resolve every field spec against settings into a mapping plan."""
+    scales = parse_field_factors(settings.field_scales)
+    offsets = _offsets(settings)
+    plan = []
+    for spec in FIELDS:
+        path = getattr(settings, f"{spec.key}_json")
+        plan.append(
+            _Mapping(
+                key=spec.key,
+                path=_split_path(path) if path else None,
+                fixed=getattr(settings, f"{spec.key}_value"),
+                scale=scales.get(spec.key, 1.0),
+                offset=offsets.get(spec.key),
+            )
+        )
+    return tuple(plan)
 
 
-def _overrides(settings: Settings) -> dict[str, float | None]:
-    """Extract fixed value overrides from settings."""
-    return {
-        "l1_act_power": settings.l1_act_power_value,
-        "l2_act_power": settings.l2_act_power_value,
-        "l3_act_power": settings.l3_act_power_value,
-    }
+_plan_cache: tuple[Settings, tuple[_Mapping, ...]] | None = None
+# Per-tick value buffer, refilled in place instead of reallocated every tick.
+_values: dict[str, float | None] = {}
 
 
-def _offsets(settings: Settings) -> dict[str, float | None]:
-    """Extract per-phase power offsets from settings."""
-    return {
-        "l1_act_power": settings.l1_power_offset,
-        "l2_act_power": settings.l2_power_offset,
-        "l3_act_power": settings.l3_power_offset,
-    }
+def _plan(settings: Settings) -> tuple[_Mapping, ...]:
+    """Return the compiled mapping plan for these settings."""
+    global _plan_cache
+    if _plan_cache is None or _plan_cache[0] is not settings:
+        _plan_cache = (settings, _compile(settings))
+    return _plan_cache[1]
+
+
+def _derive_phase(values: dict[str, float | None], phase: str) -> None:
+    """Fill unmapped apparent power and power factor from related readings."""
+    act = values[f"{phase}_act_power"]
+    aprt_key = f"{phase}_aprt_power"
+    if values[aprt_key] is None:
+        voltage = values[f"{phase}_voltage"]
+        current = values[f"{phase}_current"]
+        if voltage is not None and current is not None:
+            values[aprt_key] = abs(voltage * current)
+        elif act is not None:
+            values[aprt_key] = abs(act)
+    pf_key = f"{phase}_pf"
+    if values[pf_key] is None:
+        aprt = values[aprt_key]
+        if act is not None and aprt:
+            values[pf_key] = max(-1.0, min(1.0, act / aprt))
 
 
 def _merge_values(
-    source_json: dict[str, Any],
+    source_json: dict[str, Any] | None,
     settings: Settings,
+    readings: dict[str, float] | None = None,
 ) -> dict[str, float]:
-    """Merge source values with overrides and offsets."""
-    json_paths = _json_paths(settings)
-    overrides = _overrides(settings)
-    offsets = _offsets(settings)
+    """Merge source values with overrides, scales, offsets, and derived readings.
 
-    working: dict[str, float | None] = dict.fromkeys(json_paths.keys(), None)
-
-    _apply_json_values(working, source_json, json_paths)
-    _apply_value_overrides(working, overrides)
-    for key, offset in offsets.items():
-        if offset is None:
-            continue
-        if working.get(key) is None:
-            continue
-        working[key] = (working[key] or 0.0) + offset
-    for key in working:
-        if working[key] is None:
+    Pre-decoded ``readings`` (keyed by field) take the place of JSON paths.
+    Scales apply to source values only; fixed values are already in payload
+    units. The returned dict is reused by the next call.
+    """
+    working = _values
+    for mapping in _plan(settings):
+        value = None
+        if readings is not None:
+            value = readings.get(mapping.key)
+        elif mapping.path is not None:
+            value = _to_float(_get_path(source_json, mapping.path))
+        if value is None:
+            value = mapping.fixed
+        else:
+            value *= mapping.scale
+        if value is not None and mapping.offset is not None:
+            value += mapping.offset
+        working[mapping.key] = value
+    for phase, _ in PHASES:
+        _derive_phase(working, phase)
+    for key, value in working.items():
+        if value is None:
             working[key] = 0.0
+    return working  # type: ignore[return-value]
+
 
-    return {key: value for key, value in working.items() if value is not None}
+def _build(
+    method: str,
+    values: dict[str, float],
+    totals: tuple[tuple[str, str, int], ...],
+) -> dict[str, Any]:
+    """Build one status payload from the field table and per-phase totals."""
+    payload: dict[str, Any] = {"id": 0}
+    for spec in _FIELDS_BY_METHOD[method]:
+        payload[spec.target] = round(values.get(spec.key, 0.0), spec.digits)
+    for target, suffix, digits in totals:
+        total = sum(values.get(f"{phase}_{suffix}", 0.0) for phase, _ in PHASES)
+        payload[target] = round(total, digits)
+    return payload
 
 
 def build_em_status(values: dict[str, float]) -> dict[str, Any]:
     """Build an EM.GetStatus payload from merged values."""
-    return {
-        "id": 0,
-        "a_act_power": values.get("l1_act_power"),
-        "b_act_power": values.get("l2_act_power"),
-        "c_act_power": values.get("l3_act_power"),
-    }
+    payload = _build("EM.GetStatus", values, EM_TOTALS)
+    payload["user_calibrated_phase"] = []
+    return payload
+
+
+def build_emdata_status(values: dict[str, float]) -> dict[str, Any]:
+    """Build an EMData.GetStatus payload from merged values."""
+    return _build("EMData.GetStatus", values, EMDATA_TOTALS)
 
 
 def build_dynamic_payloads(
@@ -124,8 +264,25 @@ def build_dynamic_payloads(
     device_mac: str,
 ) -> dict[str, dict[str, Any]]:
     """Build dynamic RPC payloads keyed by method name."""
-    values = _merge_values(source_json, settings)
+    return _build_dynamic(_merge_values(source_json, settings), now, device_mac)
+
+
+def build_dynamic_payloads_from_readings(
+    readings: dict[str, float],
+    now: datetime,
+    settings: Settings,
+    device_mac: str,
+) -> dict[str, dict[str, Any]]:
+    """Build dynamic RPC payloads from readings already keyed by field."""
+    return _build_dynamic(_merge_values(None, settings, readings), now, device_mac)
+
+
+def _build_dynamic(
+    values: dict[str, float], now: datetime, device_mac: str
+) -> dict[str, dict[str, Any]]:
+    """Build the dynamic payloads from merged values."""
     em_status = build_em_status(values)
+    emdata_status = build_emdata_status(values)
     sys_status = {
         "mac": device_mac,
         "time": now.strftime("%H:%M"),
@@ -134,9 +291,10 @@ def build_dynamic_payloads(
     shelly_status = {
         "sys": sys_status,
         "em:0": em_status,
-        "emdata:0": dict(EMDATA_STATUS_TEMPLATE),
+        "emdata:0": emdata_status,
     }
     return {
         "Shelly.GetStatus": shelly_status,
         "EM.GetStatus": em_status,
+        "EMData.GetStatus": emdata_status,
     }
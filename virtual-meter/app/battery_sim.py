@@ -0,0 +1,301 @@
+"""Closed-loop simulation of a battery regulating grid power via the emulator.
+
+A household (load and PV profiles) and a battery inverter share one grid
+connection. ``UpstreamSimulator`` meters the resulting grid power, the real
+consumer, pipeline and aiohttp app (optionally behind the fast path) turn it
+into ``EM.GetStatus``, and a simulated battery controller polls that at its
+own cadence and moves its output toward zero grid power. Everything runs
+``speed`` times faster than real time, so a ten-minute scenario finishes in
+seconds; fixed processing and network delays are not scaled, so high speeds
+slightly overstate data age. Tests and ``benchmarks/bench_control.py`` use it;
+it also runs standalone::
+
+    python -m app.battery_sim --duration-s 600 --speed 20 --transport ws
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+import json
+import math
+from typing import Callable
+
+from aiohttp import ClientSession, ClientWebSocketResponse, web
+
+from .config import Settings
+from .consumer import HttpConsumer
+from .main import create_snapshot_handler
+from .pipeline import LatestSnapshotStage
+from .provider import create_app
+from .simulator import SimulatorConfig, UpstreamSimulator
+
+PowerProfile = Callable[[float], float]
+
+TRANSPORTS = ("http", "ws", "fastpath")
+DEVICE_MAC = "AABBCCDDEEFF"
+DEVICE_ID = "shellypro3em-aabbccddeeff"
+
+
+def household_load(t: float) -> float:
+    """Base load with a cycling fridge and a 2 kW kettle every five minutes."""
+    fridge = 120.0 if (t % 600) < 240 else 0.0
+    kettle = 2000.0 if 60 <= (t % 300) < 150 else 0.0
+    return 250.0 + fridge + kettle + 40.0 * math.sin(2 * math.pi * t / 37)
+
+
+def passing_clouds(peak_w: float = 600.0, period_s: float = 90.0) -> PowerProfile:
+    """PV output that drops to a quarter of ``peak_w`` for a third of each period."""
+    return lambda t: peak_w / 4 if (t % period_s) < period_s / 3 else peak_w
+
+
+@dataclass
+class ControlScenario:
+    """One closed-loop run; all durations are in simulated time."""
+
+    load: PowerProfile = household_load
+    pv: PowerProfile = field(default_factory=passing_clouds)
+    duration_s: float = 300.0
+    speed: float = 20.0
+    poll_interval_ms: int = 1000
+    power_offset: float = 0.0
+    transport: str = "http"
+    meter_update_s: float = 1.0
+    battery_interval_s: float = 1.0
+    controller_gain: float = 0.8
+    max_discharge_w: float = 800.0
+    max_charge_w: float = 800.0
+    ramp_w_per_s: float = 400.0
+    plant_step_s: float = 0.1
+
+
+@dataclass
+class ControlReport:
+    """Regulation quality of one scenario run (powers in W, energy in Wh)."""
+
+    scenario: ControlScenario
+    mean_abs_error_w: float
+    rms_error_w: float
+    overshoot_w: float
+    exported_wh: float
+    imported_wh: float
+    settled_grid_w: float
+    polls: int
+    failed_polls: int
+
+    def row(self) -> str:
+        """Format the report as one line of a comparison table."""
+        scenario = self.scenario
+        return (
+            f"{scenario.transport:<8} poll={scenario.poll_interval_ms:>5}ms "
+            f"offset={scenario.power_offset:>+6.0f}W "
+            f"mae={self.mean_abs_error_w:>6.1f}W rms={self.rms_error_w:>6.1f}W "
+            f"overshoot={self.overshoot_w:>6.1f}W "
+            f"export={self.exported_wh:>6.2f}Wh import={self.imported_wh:>6.2f}Wh "
+            f"settled={self.settled_grid_w:>+6.1f}W "
+            f"polls={self.polls} failed={self.failed_polls}"
+        )
+
+
+class _Plant:
+    """Household, PV and battery inverter on one grid connection."""
+
+    def __init__(self, scenario: ControlScenario) -> None:
+        self.scenario = scenario
+        self.output_w = 0.0
+        self.target_w = 0.0
+        self.grid_w = scenario.load(0.0) - scenario.pv(0.0)
+        self.t = 0.0
+        self._abs = 0.0
+        self._squares = 0.0
+        self._exported = 0.0
+        self._imported = 0.0
+        self._overshoot = 0.0
+        self._settle_from = scenario.duration_s * 0.8
+        self._settled = 0.0
+        self._settled_s = 0.0
+
+    def advance(self, t: float) -> None:
+        """Integrate the plant from the previous time to ``t``."""
+        dt = t - self.t
+        if dt <= 0:
+            return
+        scenario = self.scenario
+        ramp = scenario.ramp_w_per_s * dt
+        self.output_w += max(-ramp, min(ramp, self.target_w - self.output_w))
+        self.t = t
+        grid = scenario.load(t) - scenario.pv(t) - self.output_w
+        self.grid_w = grid
+        self._abs += abs(grid) * dt
+        self._squares += grid * grid * dt
+        if grid < 0:
+            self._exported -= grid * dt / 3600.0
+            self._overshoot = max(self._overshoot, -grid)
+        else:
+            self._imported += grid * dt / 3600.0
+        if t >= self._settle_from:
+            self._settled += grid * dt
+            self._settled_s += dt
+
+    def control(self, reported_grid_w: float) -> None:
+        """Move the inverter setpoint by the reported grid power."""
+        scenario = self.scenario
+        target = self.target_w + scenario.controller_gain * reported_grid_w
+        self.target_w = max(
+            -scenario.max_charge_w, min(scenario.max_discharge_w, target)
+        )
+
+    def report(self, polls: int, failed_polls: int) -> ControlReport:
+        """Summarize the run so far."""
+        elapsed = self.t or 1.0
+        return ControlReport(
+            scenario=self.scenario,
+            mean_abs_error_w=self._abs / elapsed,
+            rms_error_w=math.sqrt(self._squares / elapsed),
+            overshoot_w=self._overshoot,
+            exported_wh=self._exported,
+            imported_wh=self._imported,
+            settled_grid_w=self._settled / self._settled_s if self._settled_s else 0.0,
+            polls=polls,
+            failed_polls=failed_polls,
+        )
+
+
+class _BatteryClient:
+    """Read ``total_act_power`` from the emulator the way a battery would."""
+
+    def __init__(self, session: ClientSession, base_url: str, transport: str) -> None:
+        self._session = session
+        self._base_url = base_url
+        self._transport = transport
+        self._ws: ClientWebSocketResponse | None = None
+        self._request_id = 0
+
+    async def read(self) -> float | None:
+        """Poll ``EM.GetStatus`` once; None when the reading is unavailable."""
+        try:
+            if self._transport == "ws":
+                if self._ws is None:
+                    self._ws = await self._session.ws_connect(f"{self._base_url}/rpc")
+                self._request_id += 1
+                await self._ws.send_str(
+                    json.dumps({"id": self._request_id, "method": "EM.GetStatus"})
+                )
+                body = json.loads((await self._ws.receive()).data)
+            else:
+                async with self._session.get(
+                    f"{self._base_url}/rpc", params={"method": "EM.GetStatus"}
+                ) as response:
+                    body = json.loads(await response.read())
+            return float(body["result"]["total_act_power"])
+        except Exception:
+            return None
+
+    async def close(self) -> None:
+        """Close the WebSocket, if one is open."""
+        if self._ws is not None:
+            await self._ws.close()
+
+
+async def run_scenario(scenario: ControlScenario) -> ControlReport:
+    """Run one scenario against the real pipeline and HTTP app."""
+    if scenario.transport not in TRANSPORTS:
+        raise ValueError(f"Unknown transport: {scenario.transport}")
+    speed = scenario.speed
+    plant = _Plant(scenario)
+    meter = UpstreamSimulator(
+        SimulatorConfig(
+            profile=lambda _t: (plant.grid_w, 0.0, 0.0),
+            update_interval_s=scenario.meter_update_s / speed,
+        )
+    )
+    endpoint = await meter.start()
+    settings = Settings(
+        provider_endpoint=endpoint,
+        poll_interval_ms=max(1, round(scenario.poll_interval_ms / speed)),
+        l1_act_power_json="StatusSNS.ENERGY.Power",
+        l1_power_offset=scenario.power_offset or None,
+        history_records=0,
+    )
+    consumer = HttpConsumer(endpoint, settings.poll_interval_ms, None, None)
+    stage = LatestSnapshotStage(create_snapshot_handler(settings, DEVICE_MAC))
+    app = create_app(settings, DEVICE_ID, None, lambda: consumer.health)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    if scenario.transport == "fastpath":
+        from .fastpath import FastPathSite
+
+        site: web.TCPSite = FastPathSite(runner, DEVICE_ID, "127.0.0.1", 0)
+    else:
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    base_url = f"http://127.0.0.1:{site.port}"
+    tasks = [
+        asyncio.create_task(stage.run()),
+        asyncio.create_task(consumer.start(stage.submit)),
+    ]
+    polls = failed_polls = 0
+    try:
+        while consumer.latest is None:
+            await asyncio.sleep(0.001)
+        await stage.drain()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        async def _plant() -> None:
+            while True:
+                plant.advance((loop.time() - started) * speed)
+                await asyncio.sleep(scenario.plant_step_s / speed)
+
+        tasks.append(asyncio.create_task(_plant()))
+        async with ClientSession() as session:
+            battery = _BatteryClient(session, base_url, scenario.transport)
+            next_poll = started
+            while (loop.time() - started) * speed < scenario.duration_s:
+                polls += 1
+                reported = await battery.read()
+                if reported is None:
+                    failed_polls += 1
+                else:
+                    plant.control(reported)
+                next_poll += scenario.battery_interval_s / speed
+                await asyncio.sleep(max(0.0, next_poll - loop.time()))
+            plant.advance((loop.time() - started) * speed)
+            await battery.close()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await consumer.stop()
+        await runner.cleanup()
+        await meter.stop()
+    return plant.report(polls, failed_polls)
+
+
+def main() -> None:
+    """Run one scenario per transport and print the reports."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration-s", type=float, default=300.0)
+    parser.add_argument("--speed", type=float, default=20.0)
+    parser.add_argument("--poll-interval-ms", type=int, default=1000)
+    parser.add_argument("--offset", type=float, default=0.0)
+    parser.add_argument("--transport", choices=TRANSPORTS, action="append")
+    args = parser.parse_args()
+    for transport in args.transport or TRANSPORTS:
+        report = asyncio.run(
+            run_scenario(
+                ControlScenario(
+                    duration_s=args.duration_s,
+                    speed=args.speed,
+                    poll_interval_ms=args.poll_interval_ms,
+                    power_offset=args.offset,
+                    transport=transport,
+                )
+            )
+        )
+        print(report.row())
+
+
+if __name__ == "__main__":
+    main()
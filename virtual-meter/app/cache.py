@@ -1,20 +1,45 @@
-"""In-memory payload cache keyed by RPC method."""
+"""In-memory payload cache keyed by RPC method.
+
+Each payload carries a version that changes only when its bytes change; it
+backs the ``ETag`` of HTTP responses and lets long-poll requests wait for the
+next version of a method.
+"""
 
 from __future__ import annotations
 
+import asyncio
+from itertools import count
+import secrets
 from typing import Iterable
 
 _payloads: dict[str, bytes] = {}
+_versions: dict[str, int] = {}
+_waiters: dict[str, list[asyncio.Future[None]]] = {}
+_version_counter = count(1)
+# Distinguishes versions of this process from those of a previous run.
+_ETAG_PREFIX = secrets.token_hex(4)
+
+
+def _store(method: str, payload: bytes) -> None:
+    """Store a payload, bumping its version and waking waiters if it changed."""
+    if _payloads.get(method) == payload:
+        return
+    _payloads[method] = payload
+    _versions[method] = next(_version_counter)
+    for waiter in _waiters.pop(method, ()):
+        if not waiter.done():
+            waiter.set_result(None)
 
 
 def set_payload(method: str, payload: bytes) -> None:
     """Store a serialized payload for a single method."""
-    _payloads[method] = payload
+    _store(method, payload)
 
 
 def set_payloads(payloads: dict[str, bytes]) -> None:
     """Store serialized payloads for multiple methods."""
-    _payloads.update(payloads)
+    for method, payload in payloads.items():
+        _store(method, payload)
 
 
 def get_payload(method: str) -> bytes | None:
@@ -22,6 +47,41 @@ def get_payload(method: str) -> bytes | None:
     return _payloads.get(method)
 
 
+def get_version(method: str) -> int | None:
+    """Return the version of the cached payload for a method."""
+    return _versions.get(method) if method in _payloads else None
+
+
+def get_etag(method: str) -> str | None:
+    """Return the quoted entity tag of the cached payload for a method."""
+    version = get_version(method)
+    return None if version is None else f'"{_ETAG_PREFIX}-{version}"'
+
+
+async def wait_for_change(method: str, version: int | None, timeout_s: float) -> bool:
+    """Wait until a method's version differs from ``version``; False on timeout."""
+    if get_version(method) != version:
+        return True
+    waiter = asyncio.get_running_loop().create_future()
+    waiters = _waiters.setdefault(method, [])
+    waiters.append(waiter)
+    try:
+        await asyncio.wait_for(waiter, timeout_s)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        if waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters and _waiters.get(method) is waiters:
+                del _waiters[method]
+
+
+def snapshot_payloads() -> dict[str, bytes]:
+    """Return a copy of all cached payloads."""
+    return dict(_payloads)
+
+
 def list_methods() -> Iterable[str]:
     """Return the iterable of cached method names."""
     return _payloads.keys()
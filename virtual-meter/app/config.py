@@ -6,7 +6,7 @@ import json
 from pathlib import Path
 from typing import Any
 
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 
 
 class Settings(BaseModel):
@@ -15,6 +15,12 @@ class Settings(BaseModel):
     provider_endpoint: str
     provider_username: str | None = None
     provider_password: str | None = None
+    provider_type: str = "http"
+    provider_modbus_host: str | None = None
+    provider_modbus_port: int = 502
+    provider_modbus_unit_id: int = 1
+    provider_modbus_registers: str = "sdm630"
+    provider_modbus_function: int = 4
     device_mac: str | None = None
     poll_interval_ms: int
     http_port: int = 80
@@ -27,7 +33,85 @@ class Settings(BaseModel):
     l3_act_power_json: str | None = None
     l3_act_power_value: float | None = None
     l3_power_offset: float | None = None
+    l1_current_json: str | None = None
+    l1_current_value: float | None = None
+    l1_voltage_json: str | None = None
+    l1_voltage_value: float | None = None
+    l1_aprt_power_json: str | None = None
+    l1_aprt_power_value: float | None = None
+    l1_pf_json: str | None = None
+    l1_pf_value: float | None = None
+    l1_freq_json: str | None = None
+    l1_freq_value: float | None = None
+    l1_total_act_energy_json: str | None = None
+    l1_total_act_energy_value: float | None = None
+    l1_total_act_ret_energy_json: str | None = None
+    l1_total_act_ret_energy_value: float | None = None
+    l2_current_json: str | None = None
+    l2_current_value: float | None = None
+    l2_voltage_json: str | None = None
+    l2_voltage_value: float | None = None
+    l2_aprt_power_json: str | None = None
+    l2_aprt_power_value: float | None = None
+    l2_pf_json: str | None = None
+    l2_pf_value: float | None = None
+    l2_freq_json: str | None = None
+    l2_freq_value: float | None = None
+    l2_total_act_energy_json: str | None = None
+    l2_total_act_energy_value: float | None = None
+    l2_total_act_ret_energy_json: str | None = None
+    l2_total_act_ret_energy_value: float | None = None
+    l3_current_json: str | None = None
+    l3_current_value: float | None = None
+    l3_voltage_json: str | None = None
+    l3_voltage_value: float | None = None
+    l3_aprt_power_json: str | None = None
+    l3_aprt_power_value: float | None = None
+    l3_pf_json: str | None = None
+    l3_pf_value: float | None = None
+    l3_freq_json: str | None = None
+    l3_freq_value: float | None = None
+    l3_total_act_energy_json: str | None = None
+    l3_total_act_energy_value: float | None = None
+    l3_total_act_ret_energy_json: str | None = None
+    l3_total_act_ret_energy_value: float | None = None
+    n_current_json: str | None = None
+    n_current_value: float | None = None
+    field_scales: str | None = None
+    field_offsets: str | None = None
     debug_logging: bool = False
+    fast_path: bool = False
+    on_demand: bool = False
+    on_demand_max_age_ms: int | None = None
+    on_demand_idle_s: int = 60
+    record_snapshots: bool = False
+    record_max_kb: int = 1024
+    record_backups: int = 2
+    replay_path: str | None = None
+    replay_speed: float = 1.0
+    modbus_server: bool = False
+    modbus_port: int = 502
+    history_records: int = 0
+    process_in_thread: bool = False
+    rate_limit_per_s: float = 0.0
+    rate_limit_burst: int = 20
+    max_concurrent_requests: int = 0
+    priority_clients: str | None = None
+    loop_watchdog: bool = True
+    loop_lag_threshold_ms: int = 250
+    admin_diagnostics: bool = False
+    socket_handoff: bool = False
+
+    @model_validator(mode="after")
+    def _check_settings(self) -> Settings:
+        """Reject a Modbus source without a meter address and bad field lists."""
+        if self.provider_type == "modbus" and not self.provider_modbus_host:
+            raise ValueError("provider_modbus_host is required for a Modbus provider")
+        from .assembler import parse_field_factors
+
+        parse_field_factors(self.field_scales)
+        parse_field_factors(self.field_offsets)
+        return self
 
 
 def _normalize_value(value: Any) -> Any:
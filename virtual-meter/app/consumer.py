@@ -1,87 +1,327 @@
-"""Poll the upstream HTTP endpoint and emit raw payload snapshots."""
+"""Poll the upstream provider and emit raw payload snapshots."""
 
 from __future__ import annotations
 
+from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Awaitable, Callable
+from enum import Enum
+import random
+import time
+from typing import Awaitable, Callable, Protocol
 
 from aiohttp import ClientSession, ClientTimeout
 import logging
 import asyncio
 
+from . import metrics
 
-@dataclass
+FETCH_TIMEOUT_S = 10.0
+PROBE_TIMEOUT_S = 2.0
+BACKOFF_MAX_MS = 10_000
+DOWN_AFTER_FAILURES = 3
+FAILURE_LOG_INTERVAL_S = 60.0
+
+
+class UpstreamHealth(Enum):
+    """Health of the upstream provider as seen by the poller."""
+
+    HEALTHY = "healthy"
+    DEGRADED = "degraded"
+    DOWN = "down"
+
+
+@dataclass(slots=True)
 class ConsumerSnapshot:
-    """Raw payload snapshot returned by the poller."""
+    """Raw payload snapshot returned by the poller.
+
+    Backends that decode their payload themselves (e.g. Modbus) also supply
+    ``readings`` keyed by field (``l1_act_power``), which bypass JSON mapping.
+    """
 
     raw: bytes
     fetched_at: datetime
+    fetch_s: float = 0.0
+    readings: dict[str, float] | None = None
+
+
+class Consumer(Protocol):
+    """Interface the pipeline and provider expect from a data source."""
+
+    latest: ConsumerSnapshot | None
+    health: UpstreamHealth
+
+    async def start(
+        self, on_update: Callable[[ConsumerSnapshot], Awaitable[None]] | None = None
+    ) -> None: ...
+
+    async def refresh(
+        self, max_age_ms: int | None = None
+    ) -> ConsumerSnapshot | None: ...
+
+    def note_demand(self) -> None: ...
+
+    def is_fresh(self, max_age_ms: int) -> bool: ...
+
+    def get_latest(self) -> ConsumerSnapshot | None: ...
+
+    async def stop(self) -> None: ...
 
 
-class HttpConsumer:
-    """Poll an HTTP endpoint on a fixed interval and track the latest snapshot."""
+class PollingConsumer(ABC):
+    """Poll an upstream source and track the latest snapshot.
+
+    Subclasses implement ``_fetch`` (one upstream request) and may override
+    ``_open``/``_close`` to manage a connection for the lifetime of ``start``.
+
+    With ``idle_timeout_s`` set, polling pauses once no client has asked for
+    data for that long and resumes on the next ``note_demand``/``refresh``.
+    Concurrent ``refresh`` calls share a single upstream request.
+
+    Consecutive failures move ``health`` to degraded and then down; polling
+    backs off exponentially with jitter and probes with a short timeout until
+    the provider answers again.
+    """
 
     def __init__(
         self,
-        endpoint: str,
         poll_interval_ms: int,
-        username: str | None,
-        password: str | None,
+        idle_timeout_s: float | None = None,
+        fetch_timeout_s: float = FETCH_TIMEOUT_S,
+        probe_timeout_s: float = PROBE_TIMEOUT_S,
     ) -> None:
-        self.endpoint = endpoint
         self.poll_interval_ms = poll_interval_ms
-        self.username = username
-        self.password = password
+        self.idle_timeout_s = idle_timeout_s
+        self.fetch_timeout_s = fetch_timeout_s
+        self.probe_timeout_s = probe_timeout_s
         self.latest: ConsumerSnapshot | None = None
-        self._session: ClientSession | None = None
+        self._on_update: Callable[[ConsumerSnapshot], Awaitable[None]] | None = None
+        self._inflight: asyncio.Future[ConsumerSnapshot | None] | None = None
+        self._latest_monotonic = 0.0
+        self._last_demand = time.monotonic()
+        self._wake = asyncio.Event()
+        self.health = UpstreamHealth.HEALTHY
+        self.failures = 0
+        self._last_failure_log = 0.0
 
     async def start(
         self, on_update: Callable[[ConsumerSnapshot], Awaitable[None]] | None = None
     ) -> None:
         """Start the polling loop and invoke the optional update callback."""
         logger = logging.getLogger("virtual_meter.poller")
-        timeout = ClientTimeout(total=10)
-        self._session = ClientSession(timeout=timeout)
+        self._open()
+        self._on_update = on_update
         logger.info(
             "Poller started (endpoint=%s, interval_ms=%s)",
-            self.endpoint,
+            self.describe(),
             self.poll_interval_ms,
         )
         try:
             while True:
+                if self._is_idle():
+                    logger.info("Poller idle (no client requests)")
+                    self._wake.clear()
+                    await self._wake.wait()
+                    logger.info("Poller resumed on client demand")
                 try:
-                    params = None
-                    if self.username and self.password:
-                        params = {"user": self.username, "password": self.password}
-                    async with self._session.get(self.endpoint, params=params) as resp:
-                        raw = await resp.read()
-                        snapshot = ConsumerSnapshot(
-                            raw=raw, fetched_at=datetime.now(timezone.utc)
-                        )
-                        self.latest = snapshot
-                        if on_update is not None:
-                            await on_update(snapshot)
-                except asyncio.TimeoutError:
-                    logger.warning(
-                        "Failed to fetch provider endpoint (10s timeout)"
-                    )
-                except Exception:
-                    logger.exception("Failed to fetch provider endpoint")
-                    # Keep last known good data
-                await _sleep_ms(self.poll_interval_ms)
+                    await self.refresh()
+                except Exception as exc:
+                    # A bug in one fetch must not end polling for good.
+                    self._record_failure("Unexpected error while polling: %r", exc)
+                    logger.debug("Poll traceback", exc_info=True)
+                await _sleep_ms(self.next_delay_ms())
         finally:
-            await self._close_session()
+            await self._close()
+
+    async def refresh(self, max_age_ms: int | None = None) -> ConsumerSnapshot | None:
+        """Return a snapshot no older than ``max_age_ms``, fetching if needed.
+
+        All callers that arrive while a fetch is in flight await that same fetch.
+        """
+        if max_age_ms is not None and self.is_fresh(max_age_ms):
+            return self.latest
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._fetch())
+            self._inflight.add_done_callback(self._clear_inflight)
+        return await asyncio.shield(self._inflight)
+
+    def note_demand(self) -> None:
+        """Record a client request and wake an idle poller."""
+        self._last_demand = time.monotonic()
+        self._wake.set()
+
+    def is_fresh(self, max_age_ms: int) -> bool:
+        """Return whether the latest snapshot is younger than ``max_age_ms``."""
+        if self.latest is None:
+            return False
+        return (time.monotonic() - self._latest_monotonic) * 1000.0 < max_age_ms
 
     def get_latest(self) -> ConsumerSnapshot | None:
         """Return the most recent snapshot (if any)."""
         return self.latest
 
     async def stop(self) -> None:
-        """Stop the poller and close any open HTTP session."""
-        await self._close_session()
+        """Stop the poller and release its connection."""
+        if self._inflight is not None:
+            self._inflight.cancel()
+        await self._close()
+
+    def next_delay_ms(self) -> float:
+        """Return the delay before the next poll, backing off after failures."""
+        if self.failures == 0:
+            return self.poll_interval_ms
+        backoff = min(BACKOFF_MAX_MS, self.poll_interval_ms * 2 ** (self.failures - 1))
+        return random.uniform(backoff / 2, backoff)
+
+    def describe(self) -> str:
+        """Return a short description of the upstream for logs."""
+        return type(self).__name__
+
+    def _timeout_s(self) -> float:
+        """Return the timeout for the next fetch (short while probing)."""
+        return self.probe_timeout_s if self.failures else self.fetch_timeout_s
+
+    @abstractmethod
+    async def _fetch(self) -> ConsumerSnapshot | None:
+        """Fetch and publish one snapshot; keep last known good data on errors."""
+
+    def _open(self) -> None:
+        """Prepare resources needed while polling."""
+
+    async def _close(self) -> None:
+        """Release resources opened by ``_open`` or ``_fetch``."""
+
+    async def _publish(self, snapshot: ConsumerSnapshot) -> ConsumerSnapshot:
+        """Store a fetched snapshot and run the update callback."""
+        self._record_success()
+        self.latest = snapshot
+        self._latest_monotonic = time.monotonic()
+        if self._on_update is not None:
+            try:
+                await self._on_update(snapshot)
+            except Exception:
+                logging.getLogger("virtual_meter.poller").exception(
+                    "Failed to process provider payload"
+                )
+        return snapshot
+
+    def _record_success(self) -> None:
+        """Return to healthy and log recovery after failures."""
+        if self.failures:
+            logging.getLogger("virtual_meter.poller").info(
+                "Provider recovered after %s failed fetches", self.failures
+            )
+        self.failures = 0
+        self.health = UpstreamHealth.HEALTHY
+
+    def _record_failure(self, message: str, *args: object) -> None:
+        """Advance the health state and log the failure at a bounded rate."""
+        logger = logging.getLogger("virtual_meter.poller")
+        metrics.increment("upstream_failures")
+        self.failures += 1
+        previous = self.health
+        if self.failures >= DOWN_AFTER_FAILURES:
+            self.health = UpstreamHealth.DOWN
+        else:
+            self.health = UpstreamHealth.DEGRADED
+        now = time.monotonic()
+        if self.failures == 1 or now - self._last_failure_log >= FAILURE_LOG_INTERVAL_S:
+            self._last_failure_log = now
+            logger.warning(
+                message + " [health=%s, consecutive_failures=%s]",
+                *args,
+                self.health.value,
+                self.failures,
+            )
+        elif self.health is not previous:
+            logger.warning(
+                "Provider marked %s after %s failed fetches",
+                self.health.value,
+                self.failures,
+            )
+        else:
+            logger.debug(message, *args)
+
+    def _clear_inflight(self, _future: asyncio.Future[ConsumerSnapshot | None]) -> None:
+        """Forget the finished fetch so the next refresh starts a new one."""
+        self._inflight = None
+
+    def _is_idle(self) -> bool:
+        """Return whether polling should pause for lack of client demand."""
+        if self.idle_timeout_s is None:
+            return False
+        return time.monotonic() - self._last_demand > self.idle_timeout_s
+
+
+class HttpConsumer(PollingConsumer):
+    """Poll a JSON-over-HTTP endpoint (e.g. Tasmota ``Status 10``)."""
+
+    def __init__(
+        self,
+        endpoint: str,
+        poll_interval_ms: int,
+        username: str | None,
+        password: str | None,
+        idle_timeout_s: float | None = None,
+        fetch_timeout_s: float = FETCH_TIMEOUT_S,
+        probe_timeout_s: float = PROBE_TIMEOUT_S,
+    ) -> None:
+        super().__init__(
+            poll_interval_ms, idle_timeout_s, fetch_timeout_s, probe_timeout_s
+        )
+        self.endpoint = endpoint
+        self.username = username
+        self.password = password
+        self._session: ClientSession | None = None
+
+    def describe(self) -> str:
+        """Return the endpoint URL."""
+        return self.endpoint
+
+    def _open(self) -> None:
+        """Create the HTTP session used for polling."""
+        self._session = ClientSession(timeout=ClientTimeout(total=self.fetch_timeout_s))
+
+    async def _fetch(self) -> ConsumerSnapshot | None:
+        """Fetch one snapshot and publish it; keep last known good data on errors."""
+        logger = logging.getLogger("virtual_meter.poller")
+        if self._session is None:
+            return self.latest
+        metrics.increment("upstream_fetches")
+        timeout_s = self._timeout_s()
+        fetch_started = time.perf_counter()
+        try:
+            params = None
+            if self.username and self.password:
+                params = {"user": self.username, "password": self.password}
+            async with self._session.get(
+                self.endpoint, params=params, timeout=ClientTimeout(total=timeout_s)
+            ) as resp:
+                raw = await resp.read()
+                if resp.status >= 400:
+                    self._record_failure(
+                        "Failed to fetch provider endpoint (HTTP %s)", resp.status
+                    )
+                    return self.latest
+        except asyncio.TimeoutError:
+            self._record_failure(
+                "Failed to fetch provider endpoint (%gs timeout)", timeout_s
+            )
+            return self.latest
+        except Exception as exc:
+            self._record_failure("Failed to fetch provider endpoint: %r", exc)
+            logger.debug("Provider fetch traceback", exc_info=True)
+            # Keep last known good data
+            return self.latest
+        return await self._publish(
+            ConsumerSnapshot(
+                raw=raw,
+                fetched_at=datetime.now(timezone.utc),
+                fetch_s=time.perf_counter() - fetch_started,
+            )
+        )
 
-    async def _close_session(self) -> None:
+    async def _close(self) -> None:
         """Close the HTTP session if it is open."""
         if self._session is not None and not self._session.closed:
             await self._session.close()
@@ -0,0 +1,350 @@
+"""Minimal HTTP/1.1 fast path for hot cached GET requests.
+
+Hoymiles polls a handful of ``GET /rpc?method=...`` URLs on a fixed timer.
+``FastPathProtocol`` answers those (and ``GET /shelly``) directly from the
+payload cache with pre-framed response bytes and hands every other request,
+including WebSocket upgrades and long-poll requests, to aiohttp's request
+handler on the same connection. Responses carry the payload's ``ETag`` and a
+matching ``If-None-Match`` is answered with a pre-framed 304.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from contextlib import suppress
+from functools import partial
+import logging
+import socket
+from typing import Callable
+from urllib.parse import parse_qsl
+
+from aiohttp import web
+
+from . import metrics
+from .cache import get_etag, get_payload
+from .limits import FRAMED_RATE_LIMITED, RequestLimiter
+from .provider import etag_matches, jsonrpc_success_bytes
+
+SERVER_HEADER = b"ShellyHTTP/1.0.0"
+MAX_HEAD_BYTES = 8192
+MAX_FRAMED_TARGETS = 64
+KEEPALIVE_TIMEOUT_S = 75.0
+
+_HANDOFF_HEADERS = frozenset((b"upgrade", b"content-length", b"transfer-encoding"))
+
+
+class FramedResponses:
+    """Pre-framed HTTP responses keyed by request target.
+
+    Entries are rebuilt lazily whenever the cached payload object for the
+    target's method changes, so a tick costs one framing per polled method.
+    ``fresh`` may veto serving a method from cache (e.g. stale on-demand data),
+    which hands the request to aiohttp instead.
+    """
+
+    def __init__(
+        self, device_id: str, fresh: Callable[[str], bool] | None = None
+    ) -> None:
+        self.device_id = device_id
+        self.fresh = fresh
+        self._methods: dict[bytes, tuple[str, bool] | None] = {}
+        self._framed: dict[bytes, tuple[bytes, str, tuple[bytes, ...]]] = {}
+
+    def lookup(
+        self, target: bytes, keep_alive: bool, if_none_match: str | None = None
+    ) -> tuple[bytes, bool] | None:
+        """Return ``(response, not_modified)`` for a cached request target.
+
+        Nothing is counted here; the caller counts the response once it is
+        actually sent, after rate limiting.
+        """
+        try:
+            route = self._methods[target]
+        except KeyError:
+            route = _parse_target(target)
+            if len(self._methods) < MAX_FRAMED_TARGETS:
+                self._methods[target] = route
+        if route is None:
+            return None
+        method, enveloped = route
+        if self.fresh is not None and not self.fresh(method):
+            return None
+        payload = get_payload(method)
+        if payload is None:
+            return None
+        framed = self._framed.get(target)
+        if framed is None or framed[0] is not payload:
+            if enveloped:
+                body = jsonrpc_success_bytes(self.device_id, None, payload)
+            else:
+                body = bytes(payload)
+            etag = get_etag(method) or '""'
+            etag_header = b"ETag: " + etag.encode("ascii") + b"\r\n"
+            close_header = b"Connection: close\r\n"
+            framed = (
+                payload,
+                etag,
+                (
+                    _frame(body, etag_header),
+                    _frame(body, etag_header + close_header),
+                    _frame_not_modified(etag_header),
+                    _frame_not_modified(etag_header + close_header),
+                ),
+            )
+            if target in self._methods:
+                self._framed[target] = framed
+        _, etag, responses = framed
+        not_modified = etag_matches(if_none_match, etag)
+        return responses[2 * not_modified + (not keep_alive)], not_modified
+
+
+def _parse_target(target: bytes) -> tuple[str, bool] | None:
+    """Map a request target to ``(method, wrap_in_envelope)`` when fast-pathable."""
+    path, _, query = target.partition(b"?")
+    if path == b"/shelly":
+        return ("Shelly.GetDeviceInfo", False) if not query else None
+    if path != b"/rpc":
+        return None
+    params = dict(parse_qsl(query.decode("latin-1")))
+    method = params.get("method")
+    if not method or "wait" in params:
+        return None
+    return method, True
+
+
+def _frame(body: bytes, extra_headers: bytes) -> bytes:
+    """Build a complete HTTP/1.1 200 response around a JSON body."""
+    return (
+        b"HTTP/1.1 200 OK\r\n"
+        b"Content-Type: application/json\r\n"
+        b"Content-Length: " + str(len(body)).encode("ascii") + b"\r\n"
+        b"Server: " + SERVER_HEADER + b"\r\n" + extra_headers + b"\r\n" + body
+    )
+
+
+def _frame_not_modified(extra_headers: bytes) -> bytes:
+    """Build a complete HTTP/1.1 304 response."""
+    return (
+        b"HTTP/1.1 304 Not Modified\r\n"
+        b"Server: " + SERVER_HEADER + b"\r\n" + extra_headers + b"\r\n"
+    )
+
+
+class FastPathProtocol(asyncio.Protocol):
+    """Answer hot GET requests from cache; hand everything else to aiohttp."""
+
+    def __init__(
+        self,
+        responses: FramedResponses,
+        handler_factory: Callable[[], asyncio.Protocol],
+        connections: set[FastPathProtocol],
+        limiter: RequestLimiter | None = None,
+    ) -> None:
+        self._responses = responses
+        self._handler_factory = handler_factory
+        self._connections = connections
+        self._limiter = limiter
+        self._transport: asyncio.Transport | None = None
+        self._remote: str | None = None
+        self._buffer = bytearray()
+        self.last_active = 0.0
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self._transport = transport  # type: ignore[assignment]
+        peer = transport.get_extra_info("peername")
+        self._remote = peer[0] if isinstance(peer, tuple) else None
+        self._connections.add(self)
+        self.last_active = asyncio.get_running_loop().time()
+
+    def data_received(self, data: bytes) -> None:
+        self._buffer += data
+        self.last_active = asyncio.get_running_loop().time()
+        while self._transport is not None:
+            end = self._buffer.find(b"\r\n\r\n")
+            if end < 0:
+                if len(self._buffer) > MAX_HEAD_BYTES:
+                    self._handoff()
+                return
+            response = self._respond(bytes(self._buffer[:end]))
+            if response is None:
+                self._handoff()
+                return
+            del self._buffer[: end + 4]
+            body, keep_alive = response
+            self._transport.write(body)
+            if not keep_alive:
+                self.close()
+                return
+            if not self._buffer:
+                return
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self._transport = None
+        self._buffer.clear()
+        self._connections.discard(self)
+
+    def close(self) -> None:
+        """Close the connection unless it was already handed to aiohttp."""
+        transport = self._transport
+        self._transport = None
+        self._connections.discard(self)
+        if transport is not None:
+            transport.close()
+
+    def _respond(self, head: bytes) -> tuple[bytes, bool] | None:
+        """Return ``(response, keep_alive)`` or ``None`` to hand off the request."""
+        lines = head.split(b"\r\n")
+        parts = lines[0].split(b" ")
+        if len(parts) != 3 or parts[0] != b"GET":
+            return None
+        target, version = parts[1], parts[2]
+        if version == b"HTTP/1.1":
+            keep_alive = True
+        elif version == b"HTTP/1.0":
+            keep_alive = False
+        else:
+            return None
+        if_none_match = None
+        for line in lines[1:]:
+            name, _, value = line.partition(b":")
+            name = name.strip().lower()
+            if name in _HANDOFF_HEADERS:
+                return None
+            if name == b"connection":
+                tokens = value.lower()
+                if b"upgrade" in tokens:
+                    return None
+                if b"close" in tokens:
+                    keep_alive = False
+            elif name == b"if-none-match":
+                if_none_match = value.strip().decode("latin-1")
+        found = self._responses.lookup(target, keep_alive, if_none_match)
+        if found is None:
+            return None
+        if self._limiter is not None and not self._limiter.allow(self._remote):
+            return FRAMED_RATE_LIMITED, keep_alive
+        response, not_modified = found
+        metrics.increment("rpc_requests")
+        if not_modified:
+            metrics.increment("rpc_not_modified")
+        return response, keep_alive
+
+    def _handoff(self) -> None:
+        """Move the connection and any buffered bytes to aiohttp's handler."""
+        transport = self._transport
+        if transport is None:
+            return
+        self._transport = None
+        self._connections.discard(self)
+        pending = bytes(self._buffer)
+        self._buffer.clear()
+        handler = self._handler_factory()
+        transport.set_protocol(handler)
+        handler.connection_made(transport)
+        if pending:
+            handler.data_received(pending)
+
+
+class FastPathSite(web.TCPSite):
+    """TCP site that fronts aiohttp's handler with ``FastPathProtocol``."""
+
+    def __init__(
+        self,
+        runner: web.BaseRunner,
+        device_id: str,
+        host: str | None = None,
+        port: int | None = None,
+        fresh: Callable[[str], bool] | None = None,
+        limiter: RequestLimiter | None = None,
+        sock: socket.socket | None = None,
+    ) -> None:
+        super().__init__(runner, host, port)
+        self._sock = sock
+        self._responses = FramedResponses(device_id, fresh)
+        self._limiter = limiter
+        self._connections: set[FastPathProtocol] = set()
+        self._sweeper: asyncio.Task[None] | None = None
+
+    async def start(self) -> None:
+        self._runner._reg_site(self)
+        loop = asyncio.get_running_loop()
+        handler_factory = self._runner.server
+        assert handler_factory is not None
+        responses = self._responses
+        connections = self._connections
+        limiter = self._limiter
+        factory = partial(
+            FastPathProtocol, responses, handler_factory, connections, limiter
+        )
+        if self._sock is not None:
+            self._server = await loop.create_server(factory, sock=self._sock)
+        else:
+            self._server = await loop.create_server(
+                factory,
+                self._host,
+                self._port,
+                backlog=self._backlog,
+                reuse_address=self._reuse_address,
+                reuse_port=self._reuse_port,
+            )
+        if self._server.sockets:
+            self._bound_port = self._server.sockets[0].getsockname()[1]
+        else:
+            self._bound_port = self._port
+        self._sweeper = loop.create_task(self._close_idle())
+
+    async def stop(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        for connection in list(self._connections):
+            connection.close()
+        await super().stop()
+
+    async def _close_idle(self) -> None:
+        """Close keep-alive connections that stayed silent for too long."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(KEEPALIVE_TIMEOUT_S / 2)
+            deadline = loop.time() - KEEPALIVE_TIMEOUT_S
+            for connection in list(self._connections):
+                if connection.last_active < deadline:
+                    connection.close()
+
+
+async def serve(
+    app: web.Application,
+    device_id: str,
+    host: str,
+    port: int,
+    fresh: Callable[[str], bool] | None = None,
+    limiter: RequestLimiter | None = None,
+    sock: socket.socket | None = None,
+) -> None:
+    """Serve the app behind the fast path until cancelled."""
+    runner = web.AppRunner(app, handle_signals=True)
+    await runner.setup()
+    try:
+        site = FastPathSite(runner, device_id, host, port, fresh, limiter, sock)
+        await site.start()
+        logging.getLogger("virtual_meter.fastpath").info(
+            "Fast path serving on %s", site.name
+        )
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await runner.cleanup()
+
+
+def run_app(
+    app: web.Application,
+    device_id: str,
+    host: str,
+    port: int,
+    fresh: Callable[[str], bool] | None = None,
+    limiter: RequestLimiter | None = None,
+    sock: socket.socket | None = None,
+) -> None:
+    """Blocking counterpart of ``web.run_app`` for the fast path."""
+    with suppress(web.GracefulExit, KeyboardInterrupt):
+        asyncio.run(serve(app, device_id, host, port, fresh, limiter, sock))
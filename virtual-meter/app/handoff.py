@@ -0,0 +1,224 @@
+"""Zero-downtime restarts by handing listening sockets to a successor process.
+
+With ``socket_handoff`` on, the running process listens on a Unix socket at
+``HANDOFF_PATH``. A newly started process connects to it before binding any
+port; the old process sends its listening sockets (``SCM_RIGHTS``) together
+with the cached payloads, the new process serves on the same sockets right
+away and confirms, and the old process then shuts down gracefully, draining
+its open connections. Both processes accept on the shared sockets in between,
+so no connection is refused and the kernel backlog is never closed. Without a
+predecessor the new process binds the ports itself.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from contextlib import suppress
+from dataclasses import dataclass
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+from typing import Callable
+
+from .cache import snapshot_payloads
+
+HANDOFF_PATH = "/data/handoff.sock"
+HANDOFF_TIMEOUT_S = 5.0
+MAX_HANDOFF_SOCKETS = 8
+READY = b"OK"
+
+_LENGTH = struct.Struct(">I")
+
+
+def bind_listener(host: str, port: int) -> socket.socket:
+    """Bind and listen on a TCP port, ready to be served or handed off."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sock.listen(128)
+    except OSError:
+        sock.close()
+        raise
+    sock.setblocking(False)
+    return sock
+
+
+@dataclass
+class Predecessor:
+    """Sockets and payloads received from the process being replaced."""
+
+    sockets: dict[str, socket.socket]
+    payloads: dict[str, bytes]
+    _connection: socket.socket
+
+    def confirm(self) -> None:
+        """Tell the old process to stop accepting and drain."""
+        with suppress(OSError):
+            self._connection.sendall(READY)
+        self._connection.close()
+
+
+def reusable_sockets(
+    sockets: dict[str, socket.socket], ports: dict[str, int]
+) -> dict[str, socket.socket]:
+    """Keep received sockets still bound to their configured port; close the rest."""
+    kept = {}
+    for name, sock in sockets.items():
+        port = ports.get(name)
+        if port is not None and sock.getsockname()[1] == port:
+            kept[name] = sock
+            continue
+        logging.getLogger("virtual_meter.handoff").info(
+            "Not reusing the handed-off %s socket; its port changed", name
+        )
+        sock.close()
+    return kept
+
+
+def take_over(
+    path: str = HANDOFF_PATH, timeout_s: float = HANDOFF_TIMEOUT_S
+) -> Predecessor | None:
+    """Receive the listening sockets of a running instance, if there is one."""
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(timeout_s)
+    try:
+        connection.connect(path)
+        data, fds, _flags, _address = socket.recv_fds(
+            connection, 65536, MAX_HANDOFF_SOCKETS
+        )
+        if len(data) < _LENGTH.size:
+            raise ConnectionError("Truncated handoff message")
+        (length,) = _LENGTH.unpack_from(data)
+        body = bytearray(data[_LENGTH.size :])
+        while len(body) < length:
+            chunk = connection.recv(length - len(body))
+            if not chunk:
+                raise ConnectionError("Truncated handoff message")
+            body += chunk
+        message = json.loads(body)
+    except (FileNotFoundError, ConnectionRefusedError):
+        connection.close()
+        return None
+    except (OSError, ValueError) as exc:
+        connection.close()
+        logging.getLogger("virtual_meter.handoff").warning(
+            "Socket handoff failed, binding ports instead: %r", exc
+        )
+        return None
+    sockets = {
+        name: socket.socket(fileno=fd) for name, fd in zip(message["sockets"], fds)
+    }
+    payloads = {
+        method: payload.encode("utf-8")
+        for method, payload in message["payloads"].items()
+    }
+    logging.getLogger("virtual_meter.handoff").info(
+        "Took over listening sockets (%s) and %s cached payloads",
+        ", ".join(sockets),
+        len(payloads),
+    )
+    return Predecessor(sockets, payloads, connection)
+
+
+class HandoffServer:
+    """Hand this process's listening sockets to the next instance on request.
+
+    Runs in a daemon thread so a successor is served even while the event
+    loop is busy. ``on_handoff`` is called from that thread once the
+    successor confirms; it should start a graceful shutdown.
+    """
+
+    def __init__(
+        self,
+        sockets: dict[str, socket.socket],
+        on_handoff: Callable[[], None],
+        path: str = HANDOFF_PATH,
+    ) -> None:
+        self.sockets = sockets
+        self.on_handoff = on_handoff
+        self.path = path
+        self.handed_off = False
+        self._listener: socket.socket | None = None
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """Listen for a successor."""
+        with suppress(FileNotFoundError):
+            os.unlink(self.path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen(1)
+        listener.settimeout(0.5)
+        self._listener = listener
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._serve, name="socket-handoff", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self) -> None:
+        """Stop listening; the path is left to a successor after a handoff."""
+        self._stopped.set()
+        if self._listener is not None:
+            # Wakes the blocked accept() so the join below returns at once.
+            with suppress(OSError):
+                self._listener.shutdown(socket.SHUT_RDWR)
+        if self._thread is not None:
+            # Joined off the loop so shutdown cannot stall it.
+            await asyncio.to_thread(self._thread.join, 2.0)
+            self._thread = None
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+            if not self.handed_off:
+                with suppress(FileNotFoundError):
+                    os.unlink(self.path)
+
+    def _serve(self) -> None:
+        """Answer successors until one confirms the handoff."""
+        logger = logging.getLogger("virtual_meter.handoff")
+        assert self._listener is not None
+        while not self._stopped.is_set():
+            try:
+                connection, _ = self._listener.accept()
+            except TimeoutError:
+                continue
+            except OSError:
+                return
+            with connection:
+                connection.settimeout(HANDOFF_TIMEOUT_S)
+                try:
+                    self._send(connection)
+                    confirmed = connection.recv(len(READY)) == READY
+                except OSError as exc:
+                    logger.warning("Socket handoff aborted: %r", exc)
+                    continue
+            if not confirmed:
+                logger.warning("Successor did not confirm the handoff")
+                continue
+            self.handed_off = True
+            logger.info("Handed off listening sockets; draining connections")
+            self.on_handoff()
+            return
+
+    def _send(self, connection: socket.socket) -> None:
+        """Send the socket names and cached payloads with the socket fds."""
+        names = list(self.sockets)
+        body = json.dumps(
+            {
+                "sockets": names,
+                "payloads": {
+                    method: payload.decode("utf-8")
+                    for method, payload in snapshot_payloads().items()
+                },
+            }
+        ).encode("utf-8")
+        message = _LENGTH.pack(len(body)) + body
+        fds = [self.sockets[name].fileno() for name in names]
+        sent = socket.send_fds(connection, [message], fds)
+        connection.sendall(message[sent:])
@@ -0,0 +1,219 @@
+"""Fixed-capacity columnar history of per-period readings for ``EMData.GetData``.
+
+One record covers one period. As on the device, power, voltage and current are
+the mean of the period's ticks, and energy is the energy used during the
+period (the growth of the cumulative counters since the previous record).
+
+Each column is a preallocated ``array`` used as a ring buffer, with the record
+timestamps (whole Unix seconds, strictly increasing) as the index for range
+queries. Queries and the CSV export walk the ring by timestamp, so concurrent
+appends never invalidate a cursor; the CSV export is produced in bounded
+chunks and never holds the whole file.
+"""
+
+from __future__ import annotations
+
+from array import array
+import logging
+from typing import Any, Iterator
+
+from .assembler import PHASES
+
+# (history key, payload method, payload key suffix, energy counter), per phase
+# in PHASES order. Energy counters are stored as per-period deltas, the other
+# readings as per-period means.
+_PHASE_COLUMNS = (
+    ("total_act_energy", "EMData.GetStatus", "total_act_energy", True),
+    ("total_act_ret_energy", "EMData.GetStatus", "total_act_ret_energy", True),
+    ("avg_act_power", "EM.GetStatus", "act_power", False),
+    ("avg_voltage", "EM.GetStatus", "voltage", False),
+    ("avg_current", "EM.GetStatus", "current", False),
+)
+COLUMNS: tuple[tuple[str, str, str], ...] = tuple(
+    (f"{letter}_{key}", method, f"{letter}_{suffix}")
+    for _, letter in PHASES
+    for key, method, suffix, _ in _PHASE_COLUMNS
+)
+_ENERGY_COLUMNS = tuple(energy for _ in PHASES for _, _, _, energy in _PHASE_COLUMNS)
+KEYS = tuple(key for key, _, _ in COLUMNS)
+
+MAX_GETDATA_RECORDS = 720
+CSV_CHUNK_RECORDS = 256
+
+
+class HistoryError(ValueError):
+    """Invalid ``EMData.GetData`` parameters."""
+
+
+class EnergyHistory:
+    """Ring store of per-period readings indexed by timestamp."""
+
+    def __init__(self, capacity: int, period_s: int = 1) -> None:
+        if capacity < 1:
+            raise ValueError("History capacity must be positive")
+        self.capacity = capacity
+        self.period_s = max(1, period_s)
+        self._ts = array("q", [0]) * capacity
+        self._columns = tuple(array("d", [0.0]) * capacity for _ in COLUMNS)
+        self._start = 0
+        self._count = 0
+        # Running state of the newest record: per-column sums of its ticks, the
+        # tick count, the counters at the end of the previous period, and the
+        # latest raw values.
+        self._sums = [0.0] * len(COLUMNS)
+        self._samples = 0
+        self._baseline: list[float] = []
+        self._latest: list[float] | None = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def clear(self) -> None:
+        """Forget all records."""
+        self._start = 0
+        self._count = 0
+        self._latest = None
+
+    def append_payloads(
+        self, timestamp: int, payloads_by_method: dict[str, dict[str, Any]]
+    ) -> None:
+        """Record one tick from the assembled status payloads.
+
+        ``timestamp`` is snapped down to a multiple of ``period_s``; further
+        ticks within the same period update that period's means and energy.
+        """
+        timestamp = timestamp // self.period_s * self.period_s
+        values = []
+        for _, method, key in COLUMNS:
+            payload = payloads_by_method.get(method)
+            values.append((payload.get(key) if payload else None) or 0.0)
+        if self._count:
+            last = self._physical(self._count - 1)
+            last_ts = self._ts[last]
+            if timestamp == last_ts:
+                self._samples += 1
+                sums = self._sums
+                for position, value in enumerate(values):
+                    sums[position] += value
+                self._write(last, timestamp, values)
+                return
+            if timestamp < last_ts:
+                logging.getLogger("virtual_meter.history").warning(
+                    "Clock moved backwards by %ss; clearing history",
+                    last_ts - timestamp,
+                )
+                self.clear()
+        # A period's energy counts from the last reading of the previous one.
+        self._baseline = self._latest if self._latest is not None else values
+        self._sums = list(values)
+        self._samples = 1
+        if self._count < self.capacity:
+            index = self._physical(self._count)
+            self._count += 1
+        else:
+            index = self._start
+            self._start = (self._start + 1) % self.capacity
+        self._write(index, timestamp, values)
+
+    def get_data(
+        self,
+        ts: int | None = None,
+        end_ts: int | None = None,
+        limit: int = MAX_GETDATA_RECORDS,
+    ) -> dict[str, Any]:
+        """Return an ``EMData.GetData`` result for ``[ts, end_ts]``.
+
+        Records are grouped into blocks of evenly spaced timestamps. When more
+        than ``limit`` records match, ``next_record_ts`` resumes the query.
+        """
+        first, stop = self._range(ts, end_ts)
+        next_record_ts = None
+        if stop - first > limit:
+            next_record_ts = self._ts[self._physical(first + limit)]
+            stop = first + limit
+        blocks: list[dict[str, Any]] = []
+        previous_ts = None
+        for position in range(first, stop):
+            index = self._physical(position)
+            record_ts = self._ts[index]
+            if previous_ts is None or record_ts - previous_ts != self.period_s:
+                blocks.append({"ts": record_ts, "period": self.period_s, "values": []})
+            blocks[-1]["values"].append([column[index] for column in self._columns])
+            previous_ts = record_ts
+        result: dict[str, Any] = {"keys": list(KEYS), "data": blocks}
+        if next_record_ts is not None:
+            result["next_record_ts"] = next_record_ts
+        return result
+
+    def iter_csv(
+        self,
+        ts: int | None = None,
+        end_ts: int | None = None,
+        add_keys: bool = True,
+        chunk_records: int = CSV_CHUNK_RECORDS,
+    ) -> Iterator[bytes]:
+        """Yield the CSV export for ``[ts, end_ts]`` in chunks of records."""
+        if add_keys:
+            yield ("timestamp," + ",".join(KEYS) + "\n").encode("ascii")
+        cursor = ts
+        while True:
+            first, stop = self._range(cursor, end_ts)
+            stop = min(stop, first + chunk_records)
+            if first >= stop:
+                return
+            lines = []
+            for position in range(first, stop):
+                index = self._physical(position)
+                lines.append(
+                    f"{self._ts[index]},"
+                    + ",".join(repr(column[index]) for column in self._columns)
+                )
+            yield ("\n".join(lines) + "\n").encode("ascii")
+            cursor = self._ts[self._physical(stop - 1)] + 1
+
+    def _range(self, ts: int | None, end_ts: int | None) -> tuple[int, int]:
+        """Return logical positions ``[first, stop)`` of records in the range."""
+        first = 0 if ts is None else self._bisect(ts)
+        stop = self._count if end_ts is None else self._bisect(end_ts + 1)
+        return first, max(first, stop)
+
+    def _bisect(self, timestamp: int) -> int:
+        """Return the first logical position whose timestamp is >= ``timestamp``."""
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._ts[self._physical(middle)] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _physical(self, position: int) -> int:
+        """Map a logical position (0 = oldest) to an array index."""
+        return (self._start + position) % self.capacity
+
+    def _write(self, index: int, timestamp: int, values: list[float]) -> None:
+        """Store the newest record's means and energy deltas at an array index."""
+        self._latest = values
+        self._ts[index] = timestamp
+        samples = self._samples
+        for column, energy, value, total, baseline in zip(
+            self._columns, _ENERGY_COLUMNS, values, self._sums, self._baseline
+        ):
+            # A counter that went backwards (meter reset) counts as no energy.
+            column[index] = max(0.0, value - baseline) if energy else total / samples
+
+
+def parse_range(params: dict[str, Any]) -> tuple[int | None, int | None]:
+    """Read ``ts``/``end_ts`` from RPC params or a query string."""
+    bounds = []
+    for name in ("ts", "end_ts"):
+        value = params.get(name)
+        if value is None or value == "":
+            bounds.append(None)
+            continue
+        try:
+            bounds.append(int(value))
+        except (TypeError, ValueError):
+            raise HistoryError(f"Invalid argument '{name}'") from None
+    return bounds[0], bounds[1]
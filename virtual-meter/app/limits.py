@@ -0,0 +1,141 @@
+"""Per-client request rate limits and a global concurrency ceiling.
+
+Each remote address gets a token bucket refilled at ``rate_per_s`` up to
+``burst`` tokens; a request without a token is rejected with 429. While
+``max_concurrent`` requests are in flight further ones are shed with 503;
+parked long-polls do not hold a slot while they wait.
+Priority clients (e.g. the battery) bypass both. The fast path rejects with
+pre-framed bytes and aiohttp with a body-less response built from shared
+headers, so turning a client away costs no serialization.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+import time
+from typing import Callable, Iterable, Iterator
+
+from aiohttp import web
+
+from . import metrics
+from .config import Settings
+
+MAX_TRACKED_REMOTES = 1024
+RATE_LIMITED_ERROR = {"code": 429, "message": "Too many requests"}
+
+_REJECTION_HEADERS = {"Retry-After": "1", "Server": "ShellyHTTP/1.0.0"}
+FRAMED_RATE_LIMITED = (
+    b"HTTP/1.1 429 Too Many Requests\r\n"
+    b"Content-Length: 0\r\n"
+    b"Retry-After: 1\r\n"
+    b"Server: ShellyHTTP/1.0.0\r\n\r\n"
+)
+
+
+class RequestLimiter:
+    """Token buckets per remote address plus an in-flight request ceiling."""
+
+    def __init__(
+        self,
+        rate_per_s: float,
+        burst: int,
+        max_concurrent: int = 0,
+        priority: Iterable[str] = (),
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate_per_s = rate_per_s
+        self.burst = float(max(1, burst))
+        self.max_concurrent = max_concurrent
+        self.priority = frozenset(priority)
+        self.inflight = 0
+        self._clock = clock
+        self._buckets: dict[str | None, list[float]] = {}
+
+    def allow(self, remote: str | None) -> bool:
+        """Take a token for ``remote``; count and refuse when none is left."""
+        if self.rate_per_s <= 0 or remote in self.priority:
+            return True
+        now = self._clock()
+        bucket = self._buckets.get(remote)
+        if bucket is None:
+            if len(self._buckets) >= MAX_TRACKED_REMOTES:
+                self._prune(now)
+            bucket = self._buckets[remote] = [self.burst, now]
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate_per_s)
+        bucket[1] = now
+        if tokens < 1.0:
+            bucket[0] = tokens
+            metrics.increment("requests_rejected")
+            return False
+        bucket[0] = tokens - 1.0
+        return True
+
+    def acquire(self, remote: str | None) -> bool:
+        """Claim an in-flight slot; count and refuse at the ceiling."""
+        if (
+            self.max_concurrent
+            and self.inflight >= self.max_concurrent
+            and remote not in self.priority
+        ):
+            metrics.increment("requests_shed")
+            return False
+        self.inflight += 1
+        return True
+
+    def release(self) -> None:
+        """Return an in-flight slot."""
+        self.inflight -= 1
+
+    @contextmanager
+    def parked(self) -> Iterator[None]:
+        """Lend the caller's slot to other requests while it waits idle.
+
+        The slot is taken back afterwards even above the ceiling, since the
+        parked request has already been admitted.
+        """
+        self.release()
+        try:
+            yield
+        finally:
+            self.inflight += 1
+
+    def _prune(self, now: float) -> None:
+        """Forget remotes whose buckets have refilled, or the oldest half."""
+        refill_s = self.burst / self.rate_per_s
+        idle = [
+            remote
+            for remote, (_, updated) in self._buckets.items()
+            if now - updated >= refill_s
+        ]
+        if not idle:
+            by_age = sorted(self._buckets, key=lambda key: self._buckets[key][1])
+            idle = by_age[: len(by_age) // 2]
+        for remote in idle:
+            del self._buckets[remote]
+
+
+def create_limiter(settings: Settings) -> RequestLimiter | None:
+    """Return the limiter configured in settings, or None when disabled."""
+    if settings.rate_limit_per_s <= 0 and settings.max_concurrent_requests <= 0:
+        return None
+    priority = [
+        address.strip()
+        for address in (settings.priority_clients or "").split(",")
+        if address.strip()
+    ]
+    return RequestLimiter(
+        settings.rate_limit_per_s,
+        settings.rate_limit_burst,
+        settings.max_concurrent_requests,
+        priority,
+    )
+
+
+def rate_limited_response() -> web.Response:
+    """Return a 429 response without a body."""
+    return web.Response(status=429, headers=_REJECTION_HEADERS)
+
+
+def shed_response() -> web.Response:
+    """Return a 503 response without a body."""
+    return web.Response(status=503, headers=_REJECTION_HEADERS)
@@ -2,18 +2,34 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
+import math
+import os
+import signal
+import socket
 from contextlib import suppress
+from time import perf_counter
+from typing import TYPE_CHECKING, Awaitable, Callable
 
 from aiohttp import web
 
-from .assembler import build_dynamic_payloads
+from .assembler import (
+    DYNAMIC_METHODS,
+    build_dynamic_payloads,
+    build_dynamic_payloads_from_readings,
+)
 from .cache import set_payloads
-from .config import load_settings
-from .consumer import HttpConsumer, ConsumerSnapshot
+from .config import Settings, load_settings
+from .consumer import Consumer, HttpConsumer, ConsumerSnapshot, UpstreamHealth
+from .history import EnergyHistory
 from .identity import device_id, device_mac
+from .limits import create_limiter
+from .profiling import tick_timings
 from .provider import create_app
 from .serializer import decode, encode
+from .watchdog import LoopWatchdog
+from .pipeline import LatestSnapshotStage
 from .payload_templates import (
     DEVICE_INFO_TEMPLATE,
     EMDATA_STATUS_TEMPLATE,
@@ -21,6 +37,12 @@ from .payload_templates import (
 )
 from . import mdns as mdns_module
 
+if TYPE_CHECKING:
+    from .modbus import ModbusRegisters, ModbusServer
+
+# Optional subsystems (fast path, Modbus, recording/replay, socket handoff) are
+# imported where they are enabled, so a default install does not load them.
+
 
 def normalize_device_mac(value: str | None) -> str:
     """Normalize a MAC address to the Shelly-style uppercase format."""
@@ -28,6 +50,142 @@ def normalize_device_mac(value: str | None) -> str:
     return mac.replace(":", "").upper()
 
 
+def create_snapshot_handler(
+    settings: Settings,
+    device_mac_value: str,
+    registers: ModbusRegisters | None = None,
+    history: EnergyHistory | None = None,
+    offload: bool = False,
+) -> Callable[[ConsumerSnapshot], Awaitable[None]]:
+    """Return the per-tick pipeline: decode, assemble, serialize, and cache.
+
+    With ``registers`` the Modbus register image is rebuilt on the same tick;
+    with ``history`` the tick's readings are appended to the history store.
+    With ``offload`` decode/assemble/encode run in a worker thread; callers
+    must not run two ticks concurrently (``LatestSnapshotStage`` guarantees
+    this).
+    """
+    logger = logging.getLogger("virtual_meter.pipeline")
+
+    def _build(
+        snapshot: ConsumerSnapshot, timed: bool
+    ) -> tuple[dict[str, dict], dict[str, bytes], tuple[float, ...]] | None:
+        """Decode, assemble, and serialize one snapshot; no event loop access."""
+        started = perf_counter() if timed else 0.0
+        if snapshot.readings is None:
+            try:
+                payload = decode(snapshot.raw)
+            except Exception:
+                logger.exception("Failed to decode provider payload")
+                return None
+            if not isinstance(payload, dict):
+                logger.warning("Provider payload is not a JSON object")
+                return None
+            if "WARNING" in payload:
+                logger.warning("Provider warning response: %s", payload)
+        decoded = perf_counter() if timed else 0.0
+        if snapshot.readings is None:
+            dynamic_payloads_by_method = build_dynamic_payloads(
+                payload, snapshot.fetched_at, settings, device_mac_value
+            )
+        else:
+            dynamic_payloads_by_method = build_dynamic_payloads_from_readings(
+                snapshot.readings, snapshot.fetched_at, settings, device_mac_value
+            )
+        assembled = perf_counter() if timed else 0.0
+        encoded_by_method = {
+            method: encode(body) for method, body in dynamic_payloads_by_method.items()
+        }
+        encoded = perf_counter() if timed else 0.0
+        return (
+            dynamic_payloads_by_method,
+            encoded_by_method,
+            (decoded - started, assembled - decoded, encoded - assembled),
+        )
+
+    async def _handle_snapshot(snapshot: ConsumerSnapshot) -> None:
+        """Decode, assemble, serialize, and cache payloads for one poll tick."""
+        timed = tick_timings.enabled
+        if offload:
+            built = await asyncio.to_thread(_build, snapshot, timed)
+        else:
+            await asyncio.sleep(0)
+            built = _build(snapshot, timed)
+        if built is None:
+            return
+        dynamic_payloads_by_method, encoded_by_method, stages = built
+        if timed:
+            publish_started = perf_counter()
+        set_payloads(encoded_by_method)
+        if registers is not None:
+            registers.update(dynamic_payloads_by_method, snapshot.fetched_at)
+        if history is not None:
+            history.append_payloads(
+                int(snapshot.fetched_at.timestamp()), dynamic_payloads_by_method
+            )
+        if timed:
+            tick_timings.record(
+                (snapshot.fetch_s, *stages, perf_counter() - publish_started)
+            )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Updated dynamic payloads (methods=%s)",
+                sorted(dynamic_payloads_by_method.keys()),
+            )
+
+    return _handle_snapshot
+
+
+def create_consumer(settings: Settings) -> Consumer:
+    """Return the data source selected by settings."""
+    if settings.replay_path:
+        from .recorder import ReplayConsumer
+
+        return ReplayConsumer(settings.replay_path, settings.replay_speed, loop=True)
+    idle_timeout_s = settings.on_demand_idle_s if settings.on_demand else None
+    if settings.provider_type == "modbus":
+        from .modbus import ModbusConsumer, parse_register_map
+
+        return ModbusConsumer(
+            settings.provider_modbus_host or "",
+            settings.provider_modbus_port,
+            settings.provider_modbus_unit_id,
+            parse_register_map(settings.provider_modbus_registers),
+            settings.poll_interval_ms,
+            function=settings.provider_modbus_function,
+            idle_timeout_s=idle_timeout_s,
+        )
+    if settings.provider_type != "http":
+        raise ValueError(f"Unknown provider_type: {settings.provider_type}")
+    return HttpConsumer(
+        settings.provider_endpoint,
+        settings.poll_interval_ms,
+        settings.provider_username,
+        settings.provider_password,
+        idle_timeout_s=idle_timeout_s,
+    )
+
+
+def create_modbus_server(
+    settings: Settings, consumer: Consumer, sock: socket.socket | None = None
+) -> ModbusServer:
+    """Return the Modbus TCP server, tied to the consumer's demand and health.
+
+    Every read counts as client demand, so an ``on_demand`` poller keeps
+    running for Modbus-only clients, and reads fail while the upstream is down
+    instead of serving frozen registers.
+    """
+    from .modbus import ModbusRegisters, ModbusServer
+
+    def _available() -> bool:
+        consumer.note_demand()
+        return consumer.health is not UpstreamHealth.DOWN
+
+    return ModbusServer(
+        ModbusRegisters(), port=settings.modbus_port, sock=sock, available=_available
+    )
+
+
 def main() -> None:
     """Entrypoint for the add-on."""
     logging.basicConfig(
@@ -61,84 +219,190 @@ def main() -> None:
         }
     )
 
-    app = create_app(settings, device_id_value)
+    consumer = create_consumer(settings)
+    max_age_ms = settings.on_demand_max_age_ms or settings.poll_interval_ms
 
-    consumer = HttpConsumer(
-        settings.provider_endpoint,
-        settings.poll_interval_ms,
-        settings.provider_username,
-        settings.provider_password,
+    async def _on_demand(method: str) -> None:
+        """Refresh stale dynamic payloads before a client reads them."""
+        if method in DYNAMIC_METHODS:
+            consumer.note_demand()
+            await consumer.refresh(max_age_ms)
+            await stage.drain()
+
+    def _fresh_enough(method: str) -> bool:
+        """Let the fast path serve a method only while its data is usable."""
+        if method not in DYNAMIC_METHODS:
+            return True
+        if consumer.health is UpstreamHealth.DOWN:
+            return False
+        if not settings.on_demand:
+            return True
+        consumer.note_demand()
+        return consumer.is_fresh(max_age_ms)
+
+    history = None
+    if settings.history_records > 0:
+        history = EnergyHistory(
+            settings.history_records,
+            max(1, math.ceil(settings.poll_interval_ms / 1000)),
+        )
+
+    limiter = create_limiter(settings)
+    app = create_app(
+        settings,
+        device_id_value,
+        _on_demand if settings.on_demand else None,
+        lambda: consumer.health,
+        history,
+        limiter,
     )
 
-    async def _handle_snapshot(snapshot: ConsumerSnapshot) -> None:
-        """Decode, assemble, serialize, and cache payloads for one poll tick."""
-        from asyncio import sleep
+    predecessor = None
+    handoff_server = None
+    listeners: dict[str, socket.socket] = {}
+    if settings.socket_handoff:
+        from . import handoff
 
-        await sleep(0)
-        logger = logging.getLogger("virtual_meter.pipeline")
-        try:
-            payload = decode(snapshot.raw)
-        except Exception:
-            logger.exception("Failed to decode provider payload")
-            return
-        if not isinstance(payload, dict):
-            logger.warning("Provider payload is not a JSON object")
-            return
-        if "WARNING" in payload:
-            logger.warning("Provider warning response: %s", payload)
-        dynamic_payloads_by_method = build_dynamic_payloads(
-            payload, snapshot.fetched_at, settings, device_mac_value
+        predecessor = handoff.take_over()
+        if predecessor is not None:
+            ports = {"http": settings.http_port}
+            if settings.modbus_server:
+                ports["modbus"] = settings.modbus_port
+            listeners = handoff.reusable_sockets(predecessor.sockets, ports)
+            # Static payloads were just rebuilt from the current settings.
+            set_payloads(
+                {
+                    method: payload
+                    for method, payload in predecessor.payloads.items()
+                    if method in DYNAMIC_METHODS
+                }
+            )
+        if "http" not in listeners:
+            listeners["http"] = handoff.bind_listener("0.0.0.0", settings.http_port)
+        if settings.modbus_server and "modbus" not in listeners:
+            listeners["modbus"] = handoff.bind_listener("0.0.0.0", settings.modbus_port)
+        handoff_server = handoff.HandoffServer(
+            listeners, lambda: os.kill(os.getpid(), signal.SIGTERM)
         )
-        set_payloads(
-            {
-                method: encode(body)
-                for method, body in dynamic_payloads_by_method.items()
-            }
+
+    modbus_server = None
+    if settings.modbus_server:
+        modbus_server = create_modbus_server(
+            settings, consumer, listeners.get("modbus")
         )
-        logger.debug(
-            "Updated dynamic payloads (methods=%s)",
-            sorted(dynamic_payloads_by_method.keys()),
+    handle_snapshot = create_snapshot_handler(
+        settings,
+        device_mac_value,
+        modbus_server.registers if modbus_server is not None else None,
+        history,
+        offload=settings.process_in_thread,
+    )
+    stage = LatestSnapshotStage(handle_snapshot)
+    watchdog = None
+    if settings.loop_watchdog:
+        watchdog = LoopWatchdog(settings.loop_lag_threshold_ms)
+    recorder = None
+    if settings.record_snapshots and settings.replay_path:
+        # Re-recording a replay would rotate over the file being replayed.
+        logging.getLogger("virtual_meter.recorder").warning(
+            "record_snapshots is ignored while replay_path is set"
+        )
+    elif settings.record_snapshots:
+        from .recorder import RECORDING_PATH, SnapshotRecorder
+
+        recorder = SnapshotRecorder(
+            RECORDING_PATH, settings.record_max_kb * 1024, settings.record_backups
         )
 
+    async def _on_snapshot(snapshot: ConsumerSnapshot) -> None:
+        """Record the raw snapshot when enabled and hand it to the pipeline."""
+        if recorder is not None and snapshot.readings is None:
+            recorder.append(snapshot)
+        await stage.submit(snapshot)
+
     async def _start_background(app: web.Application) -> None:
-        """Start the consumer polling task."""
+        """Start the pipeline and consumer polling tasks."""
         from asyncio import sleep
 
         await sleep(0)
         from asyncio import create_task
 
-        app["consumer_task"] = create_task(consumer.start(_handle_snapshot))
+        app["pipeline_task"] = create_task(stage.run())
+        app["consumer_task"] = create_task(consumer.start(_on_snapshot))
         logging.getLogger("virtual_meter.poller").info("Poller task started")
+        if modbus_server is not None:
+            await modbus_server.start()
+        if watchdog is not None:
+            watchdog.start()
+        if predecessor is not None:
+            predecessor.confirm()
+        if handoff_server is not None:
+            handoff_server.start()
 
     async def _cleanup(app: web.Application) -> None:
         """Stop background tasks and close resources."""
         from asyncio import sleep
 
         await sleep(0)
-        task = app.get("consumer_task")
-        if task:
-            task.cancel()
-            with suppress(Exception):
-                await task
+        if handoff_server is not None:
+            await handoff_server.stop()
+        if watchdog is not None:
+            await watchdog.stop()
+        if modbus_server is not None:
+            await modbus_server.stop()
+        for name in ("consumer_task", "pipeline_task"):
+            task = app.get(name)
+            if task:
+                task.cancel()
+                with suppress(Exception):
+                    await task
         await consumer.stop()
+        if recorder is not None:
+            recorder.close()
         logging.getLogger("virtual_meter.poller").info("Poller task stopped")
 
     app.on_startup.append(_start_background)
     app.on_cleanup.append(_cleanup)
 
     mdns_module.SERVICE_NAME = device_id_value
-    mdns = mdns_module.start_mdns(port=settings.http_port)
+    mdns = mdns_module.start_mdns(
+        port=settings.http_port, cooperating=predecessor is not None
+    )
 
     async def _mdns_cleanup(app: web.Application) -> None:
-        """Stop the mDNS broadcaster on shutdown."""
-        mdns.close()
+        """Stop the mDNS broadcaster on shutdown.
+
+        After a handoff the successor answers for the name, so no goodbye is
+        sent; the advertiser goes away with the process.
+        """
+        if handoff_server is None or not handoff_server.handed_off:
+            mdns.close()
         from asyncio import sleep
 
         await sleep(0)
 
     app.on_cleanup.append(_mdns_cleanup)
 
-    web.run_app(app, host="0.0.0.0", port=settings.http_port)
+    if settings.fast_path and settings.debug_logging:
+        logging.getLogger("virtual_meter.fastpath").info(
+            "Fast path disabled while debug logging is enabled"
+        )
+    if settings.fast_path and not settings.debug_logging:
+        from . import fastpath
+
+        fastpath.run_app(
+            app,
+            device_id_value,
+            "0.0.0.0",
+            settings.http_port,
+            _fresh_enough,
+            limiter,
+            listeners.get("http"),
+        )
+    elif "http" in listeners:
+        web.run_app(app, sock=listeners["http"])
+    else:
+        web.run_app(app, host="0.0.0.0", port=settings.http_port)
 
 
 if __name__ == "__main__":
@@ -43,8 +43,12 @@ class MDNSAdvertiser:
         self.zeroconf.close()
 
 
-def start_mdns(port: int = 80) -> MDNSAdvertiser:
-    """Start zeroconf service advertisement."""
+def start_mdns(port: int = 80, cooperating: bool = False) -> MDNSAdvertiser:
+    """Start zeroconf service advertisement.
+
+    ``cooperating`` skips the name conflict probe, for a successor that takes
+    over from a process still answering for the same name.
+    """
     zeroconf = Zeroconf()
     ip = _resolve_ip()
     info = ServiceInfo(
@@ -55,7 +59,7 @@ def start_mdns(port: int = 80) -> MDNSAdvertiser:
         properties=TXT_RECORDS,
         server=f"{SERVICE_NAME}.local.",
     )
-    zeroconf.register_service(info)
+    zeroconf.register_service(info, cooperating_responders=cooperating)
     logging.getLogger("virtual_meter.mdns").info(
         "mDNS advertised (name=%s, ip=%s, port=%s)", SERVICE_NAME, ip, port
     )
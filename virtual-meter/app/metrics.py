@@ -0,0 +1,20 @@
+"""In-process runtime counters keyed by metric name."""
+
+from __future__ import annotations
+
+_counters: dict[str, int] = {}
+
+
+def increment(name: str, amount: int = 1) -> None:
+    """Add ``amount`` to the named counter."""
+    _counters[name] = _counters.get(name, 0) + amount
+
+
+def get(name: str) -> int:
+    """Return the current value of a counter (zero when never incremented)."""
+    return _counters.get(name, 0)
+
+
+def snapshot() -> dict[str, int]:
+    """Return a copy of all counters."""
+    return dict(_counters)
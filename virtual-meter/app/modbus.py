@@ -0,0 +1,376 @@
+"""Modbus TCP: Pro 3EM register server and meter client backend.
+
+The server packs readings once per tick into an immutable register image, so a
+read request is answered with a slice of that image. Function codes 4 (read
+input registers, what the Pro 3EM serves) and 3 (read holding registers, for
+clients that only speak FC3) return the same data. Floats are IEEE-754 float32
+with the low word first, as on the device.
+
+``ModbusConsumer`` reads a meter (e.g. an Eastron SDM630) the other way round:
+one batched read of the configured register block per tick, decoded straight
+into field readings. Meter floats are float32 with the high word first.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from contextlib import suppress
+from datetime import datetime, timezone
+from functools import partial
+import logging
+import socket
+import struct
+import time
+from typing import Any, Callable
+
+from . import metrics
+from .assembler import FIELD_KEYS
+from .consumer import (
+    FETCH_TIMEOUT_S,
+    PROBE_TIMEOUT_S,
+    ConsumerSnapshot,
+    PollingConsumer,
+)
+
+MODBUS_PORT = 502
+
+READ_HOLDING_REGISTERS = 3
+READ_INPUT_REGISTERS = 4
+MAX_READ_REGISTERS = 125
+MAX_REGISTER_ADDRESS = 0xFFFF
+
+ILLEGAL_FUNCTION = 1
+ILLEGAL_DATA_ADDRESS = 2
+ILLEGAL_DATA_VALUE = 3
+SERVER_DEVICE_FAILURE = 4
+
+EM_BASE = 31000
+EMDATA_BASE = 31160
+REGISTER_COUNT = 180
+
+# (register address, payload method, payload key) for float32 readings.
+FLOAT_REGISTERS: tuple[tuple[int, str, str], ...] = (
+    (31011, "EM.GetStatus", "total_current"),
+    (31013, "EM.GetStatus", "total_act_power"),
+    (31015, "EM.GetStatus", "total_aprt_power"),
+    (31018, "EM.GetStatus", "n_current"),
+    *(
+        (EM_BASE + 20 * (index + 1) + offset, "EM.GetStatus", f"{letter}_{key}")
+        for index, letter in enumerate("abc")
+        for offset, key in (
+            (0, "voltage"),
+            (2, "current"),
+            (4, "act_power"),
+            (6, "aprt_power"),
+            (8, "pf"),
+        )
+    ),
+    (31162, "EMData.GetStatus", "total_act"),
+    (31164, "EMData.GetStatus", "total_act_ret"),
+)
+# uint32 unix timestamps of the last update per component.
+TIMESTAMP_REGISTERS = (EM_BASE, EMDATA_BASE)
+
+_MBAP = struct.Struct(">HHHB")
+_READ_REQUEST = struct.Struct(">BHH")
+_F32 = struct.Struct(">f")
+_WORDS = struct.Struct(">HH")
+_U32 = struct.Struct(">I")
+
+
+# Meter register maps selectable by name: field key -> register address.
+REGISTER_PRESETS: dict[str, dict[str, int]] = {
+    # Eastron SDM630 input registers (FC4).
+    "sdm630": {
+        **{f"l{phase}_voltage": 2 * (phase - 1) for phase in (1, 2, 3)},
+        **{f"l{phase}_current": 6 + 2 * (phase - 1) for phase in (1, 2, 3)},
+        **{f"l{phase}_act_power": 12 + 2 * (phase - 1) for phase in (1, 2, 3)},
+        **{f"l{phase}_aprt_power": 18 + 2 * (phase - 1) for phase in (1, 2, 3)},
+        **{f"l{phase}_pf": 30 + 2 * (phase - 1) for phase in (1, 2, 3)},
+        **{f"l{phase}_freq": 70 for phase in (1, 2, 3)},
+    },
+}
+
+
+class ModbusRegisters:
+    """Register image of the emulated meter, rebuilt once per tick."""
+
+    def __init__(self, base: int = EM_BASE, count: int = REGISTER_COUNT) -> None:
+        self.base = base
+        self.count = count
+        self.image = bytes(count * 2)
+        self._buffer = bytearray(count * 2)
+
+    def update(
+        self, payloads_by_method: dict[str, dict[str, Any]], now: datetime
+    ) -> None:
+        """Pack the status payloads and publish them as a new register image."""
+        buffer = self._buffer
+        timestamp = int(now.timestamp())
+        for address in TIMESTAMP_REGISTERS:
+            _U32.pack_into(buffer, (address - self.base) * 2, timestamp)
+        for address, method, key in FLOAT_REGISTERS:
+            payload = payloads_by_method.get(method)
+            value = payload.get(key) if payload else None
+            high, low = _WORDS.unpack(_F32.pack(value or 0.0))
+            _WORDS.pack_into(buffer, (address - self.base) * 2, low, high)
+        self.image = bytes(buffer)
+
+    def read(self, address: int, count: int) -> bytes | None:
+        """Return ``count`` registers from ``address``, or None if out of range."""
+        start = address - self.base
+        if start < 0 or start + count > self.count:
+            return None
+        return self.image[start * 2 : (start + count) * 2]
+
+
+class ModbusProtocol(asyncio.Protocol):
+    """Answer Modbus TCP read requests from a ``ModbusRegisters`` image."""
+
+    def __init__(
+        self,
+        registers: ModbusRegisters,
+        connections: set,
+        available: Callable[[], bool] | None = None,
+    ) -> None:
+        self._registers = registers
+        self._connections = connections
+        self._available = available
+        self._transport: asyncio.Transport | None = None
+        self._buffer = b""
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self._transport = transport  # type: ignore[assignment]
+        self._connections.add(self)
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self._connections.discard(self)
+        self._transport = None
+
+    def close(self) -> None:
+        """Close the connection."""
+        if self._transport is not None:
+            self._transport.close()
+
+    def data_received(self, data: bytes) -> None:
+        buffer = self._buffer + data if self._buffer else data
+        while len(buffer) >= _MBAP.size:
+            transaction, protocol, length, unit = _MBAP.unpack_from(buffer)
+            if protocol != 0 or length < 2:
+                self.close()
+                return
+            end = _MBAP.size - 1 + length
+            if len(buffer) < end:
+                break
+            pdu = buffer[_MBAP.size : end]
+            buffer = buffer[end:]
+            response = self._respond(pdu)
+            self._transport.write(  # type: ignore[union-attr]
+                _MBAP.pack(transaction, 0, len(response) + 1, unit) + response
+            )
+        self._buffer = buffer
+
+    def _respond(self, pdu: bytes) -> bytes:
+        """Return the response PDU for one request PDU."""
+        function = pdu[0]
+        if function not in (READ_HOLDING_REGISTERS, READ_INPUT_REGISTERS):
+            return bytes((function | 0x80, ILLEGAL_FUNCTION))
+        if len(pdu) != _READ_REQUEST.size:
+            return bytes((function | 0x80, ILLEGAL_DATA_VALUE))
+        _, address, count = _READ_REQUEST.unpack(pdu)
+        if not 1 <= count <= MAX_READ_REGISTERS:
+            return bytes((function | 0x80, ILLEGAL_DATA_VALUE))
+        if self._available is not None and not self._available():
+            return bytes((function | 0x80, SERVER_DEVICE_FAILURE))
+        data = self._registers.read(address, count)
+        if data is None:
+            return bytes((function | 0x80, ILLEGAL_DATA_ADDRESS))
+        return bytes((function, len(data))) + data
+
+
+class ModbusServer:
+    """Serve a ``ModbusRegisters`` image over Modbus TCP.
+
+    ``available`` is called for every valid read; when it returns False the
+    read is answered with a server device failure exception.
+    """
+
+    def __init__(
+        self,
+        registers: ModbusRegisters,
+        host: str = "0.0.0.0",
+        port: int = MODBUS_PORT,
+        sock: socket.socket | None = None,
+        available: Callable[[], bool] | None = None,
+    ) -> None:
+        self.registers = registers
+        self.host = host
+        self.port = port
+        self.sock = sock
+        self.available = available
+        self._server: asyncio.Server | None = None
+        self._connections: set[ModbusProtocol] = set()
+
+    async def start(self) -> None:
+        """Start listening; ``port`` holds the bound port afterwards.
+
+        With ``sock`` the server accepts on that already listening socket.
+        """
+        loop = asyncio.get_running_loop()
+        factory = partial(
+            ModbusProtocol, self.registers, self._connections, self.available
+        )
+        if self.sock is not None:
+            self._server = await loop.create_server(factory, sock=self.sock)
+        else:
+            self._server = await loop.create_server(factory, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logging.getLogger("virtual_meter.modbus").info(
+            "Modbus TCP server started (port=%s)", self.port
+        )
+
+    async def stop(self) -> None:
+        """Stop listening and close open connections."""
+        if self._server is None:
+            return
+        self._server.close()
+        for connection in list(self._connections):
+            connection.close()
+        await self._server.wait_closed()
+        self._server = None
+
+
+def parse_register_map(spec: str) -> dict[str, int]:
+    """Resolve a preset name or ``field=address, ...`` list to a register map."""
+    preset = REGISTER_PRESETS.get(spec.strip().lower())
+    if preset is not None:
+        return dict(preset)
+    registers: dict[str, int] = {}
+    for item in spec.split(","):
+        key, separator, address = item.partition("=")
+        key = key.strip()
+        if not separator or key not in FIELD_KEYS:
+            raise ValueError(f"Invalid Modbus register mapping: {item.strip()!r}")
+        value = int(address.strip(), 0)
+        if not 0 <= value <= MAX_REGISTER_ADDRESS:
+            raise ValueError(f"Modbus register address out of range: {item.strip()!r}")
+        registers[key] = value
+    return registers
+
+
+class ModbusConsumer(PollingConsumer):
+    """Poll a Modbus TCP meter with one batched register read per tick."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        unit_id: int,
+        registers: dict[str, int],
+        poll_interval_ms: int,
+        function: int = READ_INPUT_REGISTERS,
+        idle_timeout_s: float | None = None,
+        fetch_timeout_s: float = FETCH_TIMEOUT_S,
+        probe_timeout_s: float = PROBE_TIMEOUT_S,
+    ) -> None:
+        super().__init__(
+            poll_interval_ms, idle_timeout_s, fetch_timeout_s, probe_timeout_s
+        )
+        if not registers:
+            raise ValueError("Modbus register map is empty")
+        start = min(registers.values())
+        count = max(registers.values()) + 2 - start
+        if start < 0 or start + count > MAX_REGISTER_ADDRESS + 1:
+            raise ValueError(
+                f"Modbus registers must lie within 0-{MAX_REGISTER_ADDRESS}"
+            )
+        if count > MAX_READ_REGISTERS:
+            raise ValueError(
+                f"Modbus register block spans {count} registers "
+                f"(max {MAX_READ_REGISTERS})"
+            )
+        self.host = host
+        self.port = port
+        self.unit_id = unit_id
+        self._response_size = 2 + count * 2
+        # Byte offset of each field within the response PDU.
+        self._fields = tuple(
+            (key, 2 + (address - start) * 2) for key, address in registers.items()
+        )
+        self._request = _READ_REQUEST.pack(function, start, count)
+        self._transaction = 0
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+
+    def describe(self) -> str:
+        """Return the meter address."""
+        return f"modbus://{self.host}:{self.port}/{self.unit_id}"
+
+    async def _fetch(self) -> ConsumerSnapshot | None:
+        """Read the register block and publish it as field readings."""
+        metrics.increment("upstream_fetches")
+        timeout_s = self._timeout_s()
+        fetch_started = time.perf_counter()
+        try:
+            pdu = await asyncio.wait_for(self._exchange(), timeout_s)
+            if len(pdu) < 2:
+                raise ConnectionError(f"Truncated Modbus response: {pdu!r}")
+        except asyncio.TimeoutError:
+            await self._close()
+            self._record_failure("Failed to read Modbus meter (%gs timeout)", timeout_s)
+            return self.latest
+        except Exception as exc:
+            await self._close()
+            self._record_failure("Failed to read Modbus meter: %r", exc)
+            logging.getLogger("virtual_meter.poller").debug(
+                "Modbus read traceback", exc_info=True
+            )
+            return self.latest
+        if pdu[0] & 0x80:
+            self._record_failure("Modbus meter returned exception code %s", pdu[1])
+            return self.latest
+        if len(pdu) != self._response_size:
+            self._record_failure("Unexpected Modbus response size %s", len(pdu))
+            return self.latest
+        readings = {
+            key: _F32.unpack_from(pdu, offset)[0] for key, offset in self._fields
+        }
+        return await self._publish(
+            ConsumerSnapshot(
+                raw=pdu,
+                fetched_at=datetime.now(timezone.utc),
+                fetch_s=time.perf_counter() - fetch_started,
+                readings=readings,
+            )
+        )
+
+    async def _exchange(self) -> bytes:
+        """Send the read request and return the response PDU."""
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        assert self._reader is not None
+        self._transaction = (self._transaction + 1) & 0xFFFF
+        self._writer.write(
+            _MBAP.pack(self._transaction, 0, len(self._request) + 1, self.unit_id)
+            + self._request
+        )
+        transaction, protocol, length, _unit = _MBAP.unpack(
+            await self._reader.readexactly(_MBAP.size)
+        )
+        if length < 2:
+            raise ConnectionError(f"Invalid Modbus response length {length}")
+        pdu = await self._reader.readexactly(length - 1)
+        if transaction != self._transaction or protocol != 0:
+            raise ConnectionError("Mismatched Modbus response")
+        return pdu
+
+    async def _close(self) -> None:
+        """Close the meter connection if it is open."""
+        if self._writer is not None:
+            writer = self._writer
+            self._reader = self._writer = None
+            writer.close()
+            with suppress(Exception):
+                await writer.wait_closed()
@@ -0,0 +1,61 @@
+"""Latest-value-wins hand-off between the poller and snapshot processing."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from . import metrics
+from .consumer import ConsumerSnapshot
+
+
+class LatestSnapshotStage:
+    """Process the newest submitted snapshot, dropping superseded ones.
+
+    ``submit`` only fills a one-element slot and returns, so the poller never
+    waits on processing. ``run`` handles one snapshot at a time; a snapshot
+    replaced in the slot before it was picked up is counted as dropped.
+    """
+
+    def __init__(self, handler: Callable[[ConsumerSnapshot], Awaitable[None]]) -> None:
+        self.handler = handler
+        self._pending: ConsumerSnapshot | None = None
+        self._ready = asyncio.Event()
+        self._submitted = 0
+        self._completed = 0
+        self._condition = asyncio.Condition()
+
+    async def submit(self, snapshot: ConsumerSnapshot) -> None:
+        """Offer a snapshot to the processor without waiting for it."""
+        if self._pending is not None:
+            metrics.increment("snapshots_dropped")
+        self._pending = snapshot
+        self._submitted += 1
+        self._ready.set()
+
+    async def drain(self) -> None:
+        """Wait until everything submitted so far has been processed."""
+        target = self._submitted
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._completed >= target)
+
+    async def run(self) -> None:
+        """Process snapshots until cancelled."""
+        logger = logging.getLogger("virtual_meter.pipeline")
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            snapshot, self._pending = self._pending, None
+            sequence = self._submitted
+            if snapshot is None:
+                continue
+            try:
+                await self.handler(snapshot)
+                metrics.increment("snapshots_processed")
+            except Exception:
+                logger.exception("Failed to process provider payload")
+            finally:
+                async with self._condition:
+                    self._completed = sequence
+                    self._condition.notify_all()
@@ -0,0 +1,140 @@
+"""Runtime pipeline tick timing, on-demand cProfile capture, memory probes.
+
+Both stay compiled in for production: tick timing costs one attribute check
+per tick while disabled, and cProfile only runs during an explicit capture.
+The memory helpers are for benchmarks and tests and import ``resource`` and
+``tracemalloc`` only when called.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from array import array
+import sys
+from typing import Awaitable, Callable
+
+STAGES = ("fetch", "decode", "assemble", "encode", "publish")
+MAX_PROFILE_S = 60.0
+
+
+class TickTimings:
+    """Fixed-size ring buffer of per-stage tick durations (seconds)."""
+
+    def __init__(self, capacity: int = 256) -> None:
+        self.enabled = False
+        self.capacity = capacity
+        self._columns = {stage: array("d", [0.0]) * capacity for stage in STAGES}
+        self._next = 0
+        self._count = 0
+
+    def record(self, durations: tuple[float, ...]) -> None:
+        """Store one tick's stage durations, overwriting the oldest entry."""
+        index = self._next
+        for stage, duration in zip(STAGES, durations):
+            self._columns[stage][index] = duration
+        self._next = (index + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def clear(self) -> None:
+        """Forget all recorded ticks."""
+        self._next = 0
+        self._count = 0
+
+    def summary(self) -> dict[str, object]:
+        """Return count plus last/p50/p99/max per stage in milliseconds."""
+        stages: dict[str, dict[str, float]] = {}
+        last = (self._next - 1) % self.capacity
+        for stage, column in self._columns.items():
+            values = sorted(column[: self._count])
+            if not values:
+                continue
+            stages[stage] = {
+                "last_ms": column[last] * 1000.0,
+                "p50_ms": values[len(values) // 2] * 1000.0,
+                "p99_ms": values[min(len(values) - 1, int(len(values) * 0.99))]
+                * 1000.0,
+                "max_ms": values[-1] * 1000.0,
+            }
+        return {"enabled": self.enabled, "ticks": self._count, "stages": stages}
+
+
+tick_timings = TickTimings()
+
+_profile_running = False
+
+
+def profile_running() -> bool:
+    """Return whether a cProfile capture is in progress."""
+    return _profile_running
+
+
+async def capture_profile(seconds: float, limit: int = 40) -> str:
+    """Profile the running process for ``seconds`` and return pstats text."""
+    import cProfile
+    import io
+    import pstats
+
+    global _profile_running
+    if _profile_running:
+        raise RuntimeError("A profile capture is already running")
+    _profile_running = True
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            await asyncio.sleep(min(max(seconds, 0.0), MAX_PROFILE_S))
+        finally:
+            profiler.disable()
+    finally:
+        _profile_running = False
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats("cumulative").print_stats(limit)
+    return output.getvalue()
+
+
+def rss_bytes() -> int:
+    """Return the current resident set size (peak RSS where unavailable)."""
+    import resource
+
+    try:
+        with open("/proc/self/statm", encoding="ascii") as handle:
+            return int(handle.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+async def measure_tick_allocations(
+    tick: Callable[[], Awaitable[None]], ticks: int = 200, warmup: int = 20
+) -> dict[str, float]:
+    """Trace ``ticks`` calls of ``tick`` and report per-tick allocations.
+
+    ``peak_bytes`` is the largest transient allocation of a single tick and
+    ``retained_bytes`` the average memory a tick leaves behind after warmup.
+    """
+    import tracemalloc
+
+    for _ in range(warmup):
+        await tick()
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        peaks = []
+        for _ in range(ticks):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            await tick()
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+    return {
+        "ticks": ticks,
+        "peak_bytes": max(peaks),
+        "mean_peak_bytes": sum(peaks) / ticks,
+        "retained_bytes": retained / ticks,
+    }
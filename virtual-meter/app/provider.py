@@ -2,19 +2,108 @@
 
 from __future__ import annotations
 
+from contextlib import nullcontext
 from datetime import datetime
 import json
 import logging
-from typing import Any
+import math
+from typing import Any, Awaitable, Callable
 
 from aiohttp import web
 
-from .cache import get_payload
+from . import metrics
+from .assembler import DYNAMIC_METHODS
+from .cache import get_etag, get_payload, get_version, wait_for_change
 from .config import Settings
+from .consumer import UpstreamHealth
+from .history import EnergyHistory, HistoryError, parse_range
+from .limits import (
+    RATE_LIMITED_ERROR,
+    RequestLimiter,
+    rate_limited_response,
+    shed_response,
+)
+from .profiling import capture_profile, profile_running, tick_timings
+from .serializer import encode
+from .watchdog import lag_histogram
 
 
-def create_app(settings: Settings, device_id: str) -> web.Application:
-    """Create the aiohttp app that serves cached payloads."""
+UPSTREAM_DOWN_ERROR = {"code": -114, "message": "Upstream meter unavailable"}
+MAX_LONG_POLL_S = 30.0
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Return whether an ``If-None-Match`` header matches ``etag``."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def parse_wait(value: str) -> float:
+    """Return a long-poll timeout in seconds, capped at ``MAX_LONG_POLL_S``."""
+    wait_s = float(value)
+    if not wait_s >= 0:
+        raise ValueError(f"Invalid wait: {value}")
+    return min(wait_s, MAX_LONG_POLL_S)
+
+
+def jsonrpc_success_bytes(src: str, request_id: Any, result_bytes: bytes) -> bytes:
+    """Wrap an already-serialized result in a JSON-RPC success envelope."""
+    request_id_value = request_id if request_id is not None else 1
+    id_json = json.dumps(request_id_value, separators=(",", ":"), sort_keys=True)
+    src_json = json.dumps(src, separators=(",", ":"), sort_keys=True)
+    if not isinstance(result_bytes, (bytes, bytearray)):
+        result_bytes = str(result_bytes).encode("utf-8")
+    return (
+        b'{"jsonrpc":"2.0","id":'
+        + id_json.encode("utf-8")
+        + b',"src":'
+        + src_json.encode("utf-8")
+        + b',"result":'
+        + bytes(result_bytes)
+        + b"}"
+    )
+
+
+def jsonrpc_error_bytes(src: str, request_id: Any, error: dict[str, Any]) -> bytes:
+    """Build a JSON-RPC error envelope."""
+    request_id_value = request_id if request_id is not None else 1
+    id_json = json.dumps(request_id_value, separators=(",", ":"), sort_keys=True)
+    src_json = json.dumps(src, separators=(",", ":"), sort_keys=True)
+    error_json = json.dumps(error, separators=(",", ":"), sort_keys=True)
+    return (
+        b'{"jsonrpc":"2.0","id":'
+        + id_json.encode("utf-8")
+        + b',"src":'
+        + src_json.encode("utf-8")
+        + b',"error":'
+        + error_json.encode("utf-8")
+        + b"}"
+    )
+
+
+def create_app(
+    settings: Settings,
+    device_id: str,
+    on_demand: Callable[[str], Awaitable[None]] | None = None,
+    upstream_health: Callable[[], UpstreamHealth] | None = None,
+    history: EnergyHistory | None = None,
+    limiter: RequestLimiter | None = None,
+) -> web.Application:
+    """Create the aiohttp app that serves cached payloads.
+
+    ``on_demand`` is awaited with the method name before each cache lookup so
+    the pipeline can refresh stale data for demand-driven polling. While
+    ``upstream_health`` reports the provider as down, dynamic methods answer
+    with ``UPSTREAM_DOWN_ERROR`` instead of stale readings. With ``history``,
+    ``EMData.GetData`` and ``/emdata/0/data.csv`` serve recorded readings.
+    ``limiter`` applies per-client rate limits (HTTP requests and WebSocket
+    messages) and the concurrency ceiling before any other handling.
+    """
     app = web.Application()
     rpc_logger = logging.getLogger("virtual_meter.rpc")
     request_logger = logging.getLogger("virtual_meter.rpc.requests")
@@ -31,51 +120,109 @@ def create_app(settings: Settings, device_id: str) -> web.Application:
 
     def _jsonrpc_success_bytes(request_id: Any, result_bytes: bytes) -> bytes:
         """Wrap an already-serialized result in a JSON-RPC success envelope."""
-        request_id_value = request_id if request_id is not None else 1
-        id_json = json.dumps(request_id_value, separators=(",", ":"), sort_keys=True)
-        src_json = json.dumps(device_id, separators=(",", ":"), sort_keys=True)
-        if not isinstance(result_bytes, (bytes, bytearray)):
-            result_bytes = str(result_bytes).encode("utf-8")
-        return (
-            b'{"jsonrpc":"2.0","id":'
-            + id_json.encode("utf-8")
-            + b',"src":'
-            + src_json.encode("utf-8")
-            + b',"result":'
-            + bytes(result_bytes)
-            + b"}"
-        )
+        return jsonrpc_success_bytes(device_id, request_id, result_bytes)
 
     def _jsonrpc_error_bytes(request_id: Any, error: dict[str, Any]) -> bytes:
         """Build a JSON-RPC error envelope."""
-        request_id_value = request_id if request_id is not None else 1
-        id_json = json.dumps(request_id_value, separators=(",", ":"), sort_keys=True)
-        src_json = json.dumps(device_id, separators=(",", ":"), sort_keys=True)
-        error_json = json.dumps(error, separators=(",", ":"), sort_keys=True)
-        return (
-            b'{"jsonrpc":"2.0","id":'
-            + id_json.encode("utf-8")
-            + b',"src":'
-            + src_json.encode("utf-8")
-            + b',"error":'
-            + error_json.encode("utf-8")
-            + b"}"
-        )
+        return jsonrpc_error_bytes(device_id, request_id, error)
 
     async def _dispatch_payload(method: str) -> bytes | None:
         """Resolve a cached payload for the given RPC method."""
         from asyncio import sleep
 
         await sleep(0)
+        metrics.increment("rpc_requests")
+        if on_demand is not None:
+            await on_demand(method)
         return get_payload(method)
 
+    def _get_data_bytes(request_id: Any, params: Any) -> bytes:
+        """Answer ``EMData.GetData`` from the history store."""
+        assert history is not None
+        metrics.increment("rpc_requests")
+        try:
+            ts, end_ts = parse_range(params if isinstance(params, dict) else {})
+        except HistoryError as exc:
+            return _jsonrpc_error_bytes(request_id, {"code": -103, "message": str(exc)})
+        return _jsonrpc_success_bytes(request_id, encode(history.get_data(ts, end_ts)))
+
+    async def _rpc_response_bytes(
+        method: str, request_id: Any, params: Any = None
+    ) -> bytes:
+        """Resolve a method into a JSON-RPC success or error envelope."""
+        if method == "EMData.GetData" and history is not None:
+            return _get_data_bytes(request_id, params)
+        payload = await _dispatch_payload(method)
+        if payload is None:
+            return _jsonrpc_error_bytes(
+                request_id, {"code": -32601, "message": "Method not found"}
+            )
+        if (
+            upstream_health is not None
+            and method in DYNAMIC_METHODS
+            and upstream_health() is UpstreamHealth.DOWN
+        ):
+            return _jsonrpc_error_bytes(request_id, UPSTREAM_DOWN_ERROR)
+        return _jsonrpc_success_bytes(request_id, payload)
+
+    def _current_etag(method: str) -> str | None:
+        """Return the ETag of the method's success response, if it has one."""
+        if method == "EMData.GetData" and history is not None:
+            return None
+        if (
+            upstream_health is not None
+            and method in DYNAMIC_METHODS
+            and upstream_health() is UpstreamHealth.DOWN
+        ):
+            return None
+        return get_etag(method)
+
+    def _conditional_response(
+        request: web.Request, method: str, body: bytes
+    ) -> web.Response:
+        """Answer 304 when the client already holds the current payload."""
+        etag = _current_etag(method)
+        if etag is None:
+            return web.Response(body=body, content_type="application/json")
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            metrics.increment("rpc_not_modified")
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(
+            body=body, content_type="application/json", headers={"ETag": etag}
+        )
+
+    async def _wait_for_update(
+        request: web.Request, method: str, wait_s: float
+    ) -> None:
+        """Park a long-poll until the method publishes a newer payload.
+
+        A client whose ``If-None-Match`` is already outdated is not parked.
+        """
+        etag = _current_etag(method)
+        if etag is None:
+            return
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None and not etag_matches(if_none_match, etag):
+            return
+        version = get_version(method)
+        if on_demand is not None:
+            await on_demand(method)
+        with limiter.parked() if limiter is not None else nullcontext():
+            await wait_for_change(method, version, wait_s)
+
+    ws_rate_limited = _jsonrpc_error_bytes(None, RATE_LIMITED_ERROR)
+
     async def _ws_rpc(request: web.Request) -> web.WebSocketResponse:
         """Handle JSON-RPC over WebSocket."""
         ws = web.WebSocketResponse()
         ws.headers["Server"] = "ShellyHTTP/1.0.0"
         await ws.prepare(request)
+        remote = request.remote
         async for msg in ws:
             if msg.type == web.WSMsgType.TEXT:
+                if limiter is not None and not limiter.allow(remote):
+                    await ws.send_bytes(ws_rate_limited)
+                    continue
                 try:
                     body = json.loads(msg.data)
                 except json.JSONDecodeError:
@@ -92,13 +239,9 @@ def create_app(settings: Settings, device_id: str) -> web.Application:
                         request_id, {"code": -32600, "message": "Invalid Request"}
                     )
                 else:
-                    payload = await _dispatch_payload(method)
-                    if payload is None:
-                        response_bytes = _jsonrpc_error_bytes(
-                            request_id, {"code": -32601, "message": "Method not found"}
-                        )
-                    else:
-                        response_bytes = _jsonrpc_success_bytes(request_id, payload)
+                    response_bytes = await _rpc_response_bytes(
+                        method, request_id, body.get("params")
+                    )
                 if settings.debug_logging:
                     rpc_logger.debug(
                         json.dumps(
@@ -128,14 +271,17 @@ def create_app(settings: Settings, device_id: str) -> web.Application:
                 await response.prepare(request)
                 await response.write_eof()
                 return response
-            payload = await _dispatch_payload(method)
-            if payload is None:
-                response_bytes = _jsonrpc_error_bytes(
-                    None, {"code": -32601, "message": "Method not found"}
-                )
-            else:
-                response_bytes = _jsonrpc_success_bytes(None, payload)
-            return web.Response(body=response_bytes, content_type="application/json")
+            wait = request.query.get("wait")
+            if wait is not None:
+                try:
+                    wait_s = parse_wait(wait)
+                except ValueError:
+                    return web.Response(status=400, text="Invalid wait")
+                await _wait_for_update(request, method, wait_s)
+            response_bytes = await _rpc_response_bytes(
+                method, None, dict(request.query)
+            )
+            return _conditional_response(request, method, response_bytes)
 
         body = await request.json()
         method = body.get("method")
@@ -148,21 +294,81 @@ def create_app(settings: Settings, device_id: str) -> web.Application:
             await response.prepare(request)
             await response.write_eof()
             return response
-        payload = await _dispatch_payload(method)
-        if payload is None:
-            response_bytes = _jsonrpc_error_bytes(
-                request_id, {"code": -32601, "message": "Method not found"}
-            )
-        else:
-            response_bytes = _jsonrpc_success_bytes(request_id, payload)
+        response_bytes = await _rpc_response_bytes(
+            method, request_id, body.get("params")
+        )
         return web.Response(body=response_bytes, content_type="application/json")
 
+    async def emdata_csv(request: web.Request) -> web.StreamResponse:
+        """Stream recorded history as CSV, one chunk of records at a time."""
+        assert history is not None
+        try:
+            ts, end_ts = parse_range(request.query)
+        except HistoryError as exc:
+            return web.Response(status=400, text=str(exc))
+        add_keys = request.query.get("add_keys", "true").lower() != "false"
+        response = web.StreamResponse(
+            headers={
+                "Content-Type": "text/csv",
+                "Content-Disposition": 'attachment; filename="emdata_0.csv"',
+            }
+        )
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        for chunk in history.iter_csv(ts, end_ts, add_keys):
+            await response.write(chunk)
+        await response.write_eof()
+        return response
+
     async def shelly_info(request: web.Request) -> web.StreamResponse:
         """Return the raw Shelly.GetDeviceInfo payload."""
         payload = await _dispatch_payload("Shelly.GetDeviceInfo")
         if payload is None:
             return web.Response(status=404, body=b"", content_type="application/json")
-        return web.Response(body=payload, content_type="application/json")
+        return _conditional_response(request, "Shelly.GetDeviceInfo", payload)
+
+    async def admin_metrics(request: web.Request) -> web.Response:
+        """Return runtime counters as JSON."""
+        counters = metrics.snapshot()
+        requests = counters.get("rpc_requests", 0)
+        fetches = counters.get("upstream_fetches", 0)
+        body = {
+            "counters": counters,
+            "upstream_fetches_per_request": fetches / requests if requests else None,
+            "upstream_health": (
+                upstream_health().value if upstream_health is not None else None
+            ),
+            "loop_lag": lag_histogram.summary(),
+        }
+        return web.Response(body=encode(body), content_type="application/json")
+
+    async def admin_ticks(request: web.Request) -> web.Response:
+        """Return per-stage tick timings; POST ``{"enabled": bool}`` toggles them."""
+        if request.method == "POST":
+            try:
+                body = await request.json()
+            except Exception:
+                body = None
+            if not isinstance(body, dict) or not isinstance(body.get("enabled"), bool):
+                return web.Response(status=400, text='Expected {"enabled": true|false}')
+            tick_timings.clear()
+            tick_timings.enabled = body["enabled"]
+        return web.Response(
+            body=encode(tick_timings.summary()), content_type="application/json"
+        )
+
+    async def admin_profile(request: web.Request) -> web.Response:
+        """Run a time-boxed cProfile capture and return the pstats report."""
+        try:
+            seconds = float(request.query.get("seconds", "5"))
+        except ValueError:
+            return web.Response(status=400, text="Invalid seconds")
+        if not math.isfinite(seconds):
+            return web.Response(status=400, text="Invalid seconds")
+        if profile_running():
+            return web.Response(status=409, text="A profile capture is already running")
+        report = await capture_profile(seconds)
+        return web.Response(text=report)
 
     @web.middleware
     async def log_requests(request: web.Request, handler):
@@ -208,10 +414,36 @@ def create_app(settings: Settings, device_id: str) -> web.Application:
             request_logger.warning(json.dumps(payload, sort_keys=True))
         return response
 
+    @web.middleware
+    async def limit_requests(request: web.Request, handler):
+        """Reject over-rate clients and shed load above the concurrency ceiling."""
+        assert limiter is not None
+        remote = request.remote
+        if not limiter.allow(remote):
+            return rate_limited_response()
+        if request.headers.get("Upgrade", "").lower() == "websocket":
+            # Long-lived; messages are limited individually in _ws_rpc.
+            return await handler(request)
+        if not limiter.acquire(remote):
+            return shed_response()
+        try:
+            return await handler(request)
+        finally:
+            limiter.release()
+
+    if limiter is not None:
+        app.middlewares.append(limit_requests)
     app.middlewares.append(log_requests)
 
     app.router.add_get("/rpc", rpc_root)
     app.router.add_post("/rpc", rpc_root)
     app.router.add_get("/shelly", shelly_info)
+    if history is not None:
+        app.router.add_get("/emdata/0/data.csv", emdata_csv)
+    app.router.add_get("/admin/metrics", admin_metrics)
+    if settings.admin_diagnostics:
+        app.router.add_get("/admin/ticks", admin_ticks)
+        app.router.add_post("/admin/ticks", admin_ticks)
+        app.router.add_post("/admin/profile", admin_profile)
 
     return app
@@ -0,0 +1,159 @@
+"""Record raw provider snapshots to disk and replay them through the pipeline.
+
+A recording is a sequence of length-prefixed records, each a little-endian
+``(fetched_at epoch seconds: float64, body length: uint32)`` header followed
+by the raw provider body. Files rotate at a size bound, keeping a fixed number
+of numbered backups (``snapshots.rec.1`` is the most recent).
+"""
+
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+import logging
+import os
+from pathlib import Path
+import struct
+import time
+from typing import Awaitable, Callable, Iterator
+
+from .consumer import ConsumerSnapshot, UpstreamHealth
+
+RECORDING_PATH = "/data/snapshots.rec"
+
+_HEADER = struct.Struct("<dI")
+
+
+class SnapshotRecorder:
+    """Append snapshots to a size-bounded, rotating recording file."""
+
+    def __init__(self, path: str, max_bytes: int, backups: int = 1) -> None:
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("ab")
+        self._size = self._file.tell()
+
+    def append(self, snapshot: ConsumerSnapshot) -> None:
+        """Write one snapshot record, rotating first if it would not fit."""
+        record = (
+            _HEADER.pack(snapshot.fetched_at.timestamp(), len(snapshot.raw))
+            + snapshot.raw
+        )
+        if self._size and self._size + len(record) > self.max_bytes:
+            self._rotate()
+        self._file.write(record)
+        self._file.flush()
+        self._size += len(record)
+
+    def close(self) -> None:
+        """Close the recording file."""
+        self._file.close()
+
+    def _rotate(self) -> None:
+        """Shift numbered backups and start a fresh recording file."""
+        self._file.close()
+        if self.backups > 0:
+            for index in range(self.backups - 1, 0, -1):
+                older = self._backup(index)
+                if older.exists():
+                    os.replace(older, self._backup(index + 1))
+            os.replace(self.path, self._backup(1))
+        else:
+            self.path.unlink()
+        self._file = self.path.open("wb")
+        self._size = 0
+
+    def _backup(self, index: int) -> Path:
+        """Return the path of the numbered backup file."""
+        return self.path.with_name(f"{self.path.name}.{index}")
+
+
+def read_snapshots(path: str) -> Iterator[ConsumerSnapshot]:
+    """Yield the snapshots stored in a recording file, oldest first.
+
+    A truncated trailing record (e.g. from a crash mid-write) is ignored.
+    """
+    with open(path, "rb") as handle:
+        while True:
+            header = handle.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            timestamp, length = _HEADER.unpack(header)
+            raw = handle.read(length)
+            if len(raw) < length:
+                return
+            yield ConsumerSnapshot(
+                raw=raw, fetched_at=datetime.fromtimestamp(timestamp, timezone.utc)
+            )
+
+
+class ReplayConsumer:
+    """Feed a recording to the pipeline in place of a live provider.
+
+    ``speed`` scales the recorded inter-snapshot gaps (``2.0`` replays twice as
+    fast); ``0`` replays at maximum speed. With ``loop`` the recording restarts
+    after its last snapshot.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False) -> None:
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.latest: ConsumerSnapshot | None = None
+        self.health = UpstreamHealth.HEALTHY
+
+    async def start(
+        self, on_update: Callable[[ConsumerSnapshot], Awaitable[None]] | None = None
+    ) -> None:
+        """Replay the recording, invoking the optional update callback."""
+        logger = logging.getLogger("virtual_meter.replay")
+        logger.info("Replay started (path=%s, speed=%s)", self.path, self.speed)
+        while True:
+            replayed = await self._replay_once(on_update)
+            logger.info("Replay finished (snapshots=%s)", replayed)
+            if not self.loop or replayed == 0:
+                return
+
+    async def _replay_once(
+        self, on_update: Callable[[ConsumerSnapshot], Awaitable[None]] | None
+    ) -> int:
+        """Replay every snapshot of the recording once."""
+        started = time.monotonic()
+        first_ts: float | None = None
+        replayed = 0
+        for snapshot in read_snapshots(self.path):
+            timestamp = snapshot.fetched_at.timestamp()
+            if first_ts is None:
+                first_ts = timestamp
+            if self.speed > 0:
+                due = started + (timestamp - first_ts) / self.speed
+                await asyncio.sleep(max(0.0, due - time.monotonic()))
+            else:
+                # Reading the file and submitting never suspend; yield so the
+                # pipeline and the servers keep running at maximum speed.
+                await asyncio.sleep(0)
+            self.latest = snapshot
+            if on_update is not None:
+                await on_update(snapshot)
+            replayed += 1
+        return replayed
+
+    def note_demand(self) -> None:
+        """Replays are not demand driven."""
+
+    def is_fresh(self, max_age_ms: int) -> bool:
+        """Replayed data is always considered current."""
+        return self.latest is not None
+
+    async def refresh(self, max_age_ms: int | None = None) -> ConsumerSnapshot | None:
+        """Return the latest replayed snapshot."""
+        return self.latest
+
+    def get_latest(self) -> ConsumerSnapshot | None:
+        """Return the most recent snapshot (if any)."""
+        return self.latest
+
+    async def stop(self) -> None:
+        """Nothing to release; the replay task is cancelled by the caller."""
@@ -0,0 +1,237 @@
+"""Local stand-in for a Tasmota meter serving ``Status 10`` payloads.
+
+The simulator is an aiohttp app with a configurable power profile, meter
+update cadence, response latency distribution, and injected faults (hangs
+that trip client timeouts, truncated bodies, ``WARNING`` responses). Tests and
+benchmarks use it to exercise ``HttpConsumer`` under repeatable bad-network
+conditions; it also runs standalone::
+
+    python -m app.simulator --port 8081 --latency-ms 20 --timeout-rate 0.05
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+import json
+import math
+import random
+import time
+from typing import Callable
+
+from aiohttp import web
+
+Profile = Callable[[float], tuple[float, float, float]]
+Latency = Callable[[random.Random], float]
+
+FAULTS = ("timeout", "truncate", "warning")
+WARNING_BODY = {"WARNING": "Enable weblog 2 if response expected"}
+
+
+def constant(l1: float, l2: float = 0.0, l3: float = 0.0) -> Profile:
+    """Profile with fixed per-phase power."""
+    return lambda _t: (l1, l2, l3)
+
+
+def sine(base: float, amplitude: float, period_s: float) -> Profile:
+    """Profile oscillating around ``base`` on L1 (e.g. a cycling load)."""
+
+    def _profile(t: float) -> tuple[float, float, float]:
+        return base + amplitude * math.sin(2 * math.pi * t / period_s), 0.0, 0.0
+
+    return _profile
+
+
+def steps(levels: list[float], dwell_s: float) -> Profile:
+    """Profile cycling through L1 power levels, ``dwell_s`` seconds each."""
+    return lambda t: (levels[int(t // dwell_s) % len(levels)], 0.0, 0.0)
+
+
+def fixed_latency(ms: float) -> Latency:
+    """Latency distribution that always returns ``ms``."""
+    return lambda _rng: ms / 1000.0
+
+
+def uniform_latency(low_ms: float, high_ms: float) -> Latency:
+    """Latency drawn uniformly between two bounds."""
+    return lambda rng: rng.uniform(low_ms, high_ms) / 1000.0
+
+
+def lognormal_latency(median_ms: float, sigma: float) -> Latency:
+    """Long-tailed latency typical for Wi-Fi devices."""
+    return lambda rng: rng.lognormvariate(math.log(median_ms), sigma) / 1000.0
+
+
+@dataclass
+class SimulatorConfig:
+    """Behaviour knobs for ``UpstreamSimulator``."""
+
+    profile: Profile = field(default_factory=lambda: constant(250.0))
+    phases: int = 1
+    update_interval_s: float = 1.0
+    latency: Latency = field(default_factory=lambda: fixed_latency(0.0))
+    timeout_rate: float = 0.0
+    truncate_rate: float = 0.0
+    warning_rate: float = 0.0
+    hang_s: float = 3600.0
+    seed: int | None = 0
+
+
+class UpstreamSimulator:
+    """Serve simulated Tasmota ``Status 10`` responses with injected faults."""
+
+    def __init__(self, config: SimulatorConfig | None = None) -> None:
+        self.config = config or SimulatorConfig()
+        self.stats: dict[str, int] = dict.fromkeys(("requests", "ok", *FAULTS), 0)
+        self.last_request_at = 0.0
+        self._rng = random.Random(self.config.seed)
+        self._queued: list[str] = []
+        self._started = time.monotonic()
+        self._step = -1
+        self._power = (0.0, 0.0, 0.0)
+        self._total_kwh = 0.0
+        self._runner: web.AppRunner | None = None
+
+    def queue_faults(self, kind: str, count: int = 1) -> None:
+        """Force the next ``count`` responses to fail with ``kind``."""
+        if kind not in FAULTS:
+            raise ValueError(f"Unknown fault: {kind}")
+        self._queued.extend([kind] * count)
+
+    def clear_faults(self) -> None:
+        """Drop any queued faults so the meter answers normally again."""
+        self._queued.clear()
+
+    def create_app(self) -> web.Application:
+        """Create the aiohttp app serving ``/cm``."""
+        app = web.Application()
+        app.router.add_get("/cm", self._handle)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving and return the ``Status 10`` endpoint URL."""
+        self._runner = web.AppRunner(
+            self.create_app(), handler_cancellation=True, shutdown_timeout=1.0
+        )
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        return f"http://{host}:{site.port}/cm?cmnd=Status%2010"
+
+    async def stop(self) -> None:
+        """Stop serving."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def status10(self) -> dict:
+        """Return the current ``Status 10`` body for the simulated meter."""
+        elapsed = time.monotonic() - self._started
+        interval = self.config.update_interval_s
+        step = int(elapsed // interval) if interval > 0 else int(elapsed * 1000)
+        if step != self._step:
+            self._power = self.config.profile(step * interval)
+            if self._step >= 0:
+                hours = (step - self._step) * interval / 3600.0
+                self._total_kwh += sum(self._power) * hours / 1000.0
+            self._step = step
+        voltage = [230.0, 230.0, 230.0]
+        power = [round(value, 1) for value in self._power]
+        current = [round(abs(p) / v, 3) for p, v in zip(power, voltage)]
+        energy: dict[str, object] = {"Total": round(self._total_kwh, 3)}
+        if self.config.phases == 1:
+            energy.update(
+                Power=power[0], Voltage=voltage[0], Current=current[0], Frequency=50.0
+            )
+        else:
+            energy.update(Power=power, Voltage=voltage, Current=current, Frequency=50.0)
+        return {
+            "StatusSNS": {
+                "Time": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"),
+                "ENERGY": energy,
+            }
+        }
+
+    def _pick_fault(self) -> str | None:
+        """Return the fault for this request, if any."""
+        if self._queued:
+            return self._queued.pop(0)
+        roll = self._rng.random()
+        for kind, rate in (
+            ("timeout", self.config.timeout_rate),
+            ("truncate", self.config.truncate_rate),
+            ("warning", self.config.warning_rate),
+        ):
+            if roll < rate:
+                return kind
+            roll -= rate
+        return None
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        """Serve one request, applying latency and any injected fault."""
+        self.stats["requests"] += 1
+        self.last_request_at = time.monotonic()
+        fault = self._pick_fault()
+        delay = self.config.latency(self._rng)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if fault == "timeout":
+            self.stats["timeout"] += 1
+            await asyncio.sleep(self.config.hang_s)
+        if fault == "warning":
+            self.stats["warning"] += 1
+            return web.json_response(WARNING_BODY)
+        body = json.dumps(self.status10()).encode("utf-8")
+        if fault == "truncate":
+            self.stats["truncate"] += 1
+            response = web.StreamResponse(headers={"Content-Type": "application/json"})
+            response.content_length = len(body)
+            await response.prepare(request)
+            await response.write(body[: len(body) // 2])
+            if request.transport is not None:
+                request.transport.close()
+            return response
+        self.stats["ok"] += 1
+        return web.Response(body=body, content_type="application/json")
+
+
+def main() -> None:
+    """Run the simulator standalone."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--phases", type=int, choices=(1, 3), default=1)
+    parser.add_argument("--power", type=float, default=250.0)
+    parser.add_argument("--amplitude", type=float, default=0.0)
+    parser.add_argument("--period-s", type=float, default=60.0)
+    parser.add_argument("--update-interval-s", type=float, default=1.0)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--warning-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    config = SimulatorConfig(
+        profile=sine(args.power, args.amplitude, args.period_s),
+        phases=args.phases,
+        update_interval_s=args.update_interval_s,
+        latency=lognormal_latency(args.latency_ms, 0.5)
+        if args.latency_ms > 0
+        else fixed_latency(0.0),
+        timeout_rate=args.timeout_rate,
+        truncate_rate=args.truncate_rate,
+        warning_rate=args.warning_rate,
+        seed=None,
+    )
+    simulator = UpstreamSimulator(config)
+    web.run_app(
+        simulator.create_app(),
+        host=args.host,
+        port=args.port,
+        handler_cancellation=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
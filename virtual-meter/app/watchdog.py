@@ -0,0 +1,127 @@
+"""Event loop lag watchdog.
+
+A task wakes every ``interval_s`` and records how late it was scheduled into
+``lag_histogram``. A daemon thread watches that task's heartbeat; when the
+loop has been stuck for longer than ``threshold_ms`` it samples the loop
+thread's current stack and logs it once per stall, pointing at the blocking
+code while it is still running.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from bisect import bisect_left
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from . import metrics
+
+WATCHDOG_INTERVAL_S = 0.1
+# Upper bucket bounds in milliseconds; the last bucket is unbounded.
+LAG_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+
+class LagHistogram:
+    """Counts of loop lag samples per bucket."""
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(LAG_BUCKETS_MS) + 1)
+        self.samples = 0
+        self.max_ms = 0.0
+
+    def record(self, lag_ms: float) -> None:
+        """Add one lag sample."""
+        self.counts[bisect_left(LAG_BUCKETS_MS, lag_ms)] += 1
+        self.samples += 1
+        if lag_ms > self.max_ms:
+            self.max_ms = lag_ms
+
+    def summary(self) -> dict[str, object]:
+        """Return sample count, maximum, and per-bucket counts (``le_<ms>``)."""
+        labels = [f"le_{bound}" for bound in LAG_BUCKETS_MS] + ["inf"]
+        return {
+            "samples": self.samples,
+            "max_ms": round(self.max_ms, 1),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+lag_histogram = LagHistogram()
+
+
+class LoopWatchdog:
+    """Measure event loop lag and log the stack of long blocking calls."""
+
+    def __init__(
+        self,
+        threshold_ms: float,
+        interval_s: float = WATCHDOG_INTERVAL_S,
+        histogram: LagHistogram = lag_histogram,
+    ) -> None:
+        self.threshold_ms = threshold_ms
+        self.interval_s = interval_s
+        self.histogram = histogram
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = 0
+        self._task: asyncio.Task[None] | None = None
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """Start the lag task on the running loop and the sampling thread."""
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._measure())
+        self._thread = threading.Thread(
+            target=self._sample, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self) -> None:
+        """Stop the lag task and the sampling thread."""
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            # Joined off the loop so shutdown cannot stall it.
+            await asyncio.to_thread(self._thread.join, 1.0)
+            self._thread = None
+
+    async def _measure(self) -> None:
+        """Record how late each wake-up was scheduled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval_s
+            await asyncio.sleep(self.interval_s)
+            self._heartbeat = time.monotonic()
+            self.histogram.record(max(0.0, loop.time() - expected) * 1000.0)
+
+    def _sample(self) -> None:
+        """Log the loop thread's stack once per stall above the threshold."""
+        logger = logging.getLogger("virtual_meter.watchdog")
+        check_s = max(self.threshold_ms / 2000.0, 0.01)
+        reported = None
+        while not self._stopped.wait(check_s):
+            heartbeat = self._heartbeat
+            stalled_ms = (time.monotonic() - heartbeat - self.interval_s) * 1000.0
+            if stalled_ms < self.threshold_ms or heartbeat == reported:
+                continue
+            reported = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            metrics.increment("loop_stalls")
+            logger.warning(
+                "Event loop blocked for %.0fms; loop thread stack:\n%s",
+                stalled_ms,
+                "".join(traceback.format_stack(frame)).rstrip(),
+            )